@@ -0,0 +1,85 @@
+"""
+Cached Firebase custom tokens for /get-firebase-token.
+
+create_custom_token is an RSA signature, so it is run on a small dedicated
+thread pool (never on the event loop) and its result is reused per Clerk user
+for most of the token's one hour lifetime. Concurrent requests for the same
+user share one signing call.
+"""
+
+import asyncio
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from search_cache import SearchCache
+
+# Firebase custom tokens expire one hour after they are minted
+TOKEN_LIFETIME_SECONDS = 3600
+
+
+class FirebaseTokenCache:
+    def __init__(self, sign, max_entries: int = 10000, ttl_seconds: float = 3000, max_concurrency: int = 4):
+        """sign: blocking function uid -> token str (e.g. auth.create_custom_token + decode)."""
+        if ttl_seconds >= TOKEN_LIFETIME_SECONDS:
+            raise ValueError(f"ttl_seconds must be below the {TOKEN_LIFETIME_SECONDS}s token lifetime")
+        self._sign = sign
+        self._cache = SearchCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="firebase-sign")
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._inflight = {}
+        self._latencies = deque(maxlen=512)
+        self.signed = 0
+        self.shared = 0
+
+    async def get(self, uid: str) -> str:
+        token = self._cache.get(uid)
+        if token is not None:
+            return token
+
+        # Single-flight: a burst of requests for one user waits on the same signature. Signing
+        # runs as its own task and every caller awaits it shielded, so a caller that is
+        # cancelled (client disconnect) leaves the signature running for the others.
+        task = self._inflight.get(uid)
+        if task is not None:
+            self.shared += 1
+        else:
+            task = asyncio.ensure_future(self._sign_and_cache(uid))
+            self._inflight[uid] = task
+            task.add_done_callback(lambda t: self._done(uid, t))
+        return await asyncio.shield(task)
+
+    async def _sign_and_cache(self, uid):
+        token = await self._sign_in_pool(uid)
+        self._cache.put(uid, token)
+        return token
+
+    def _done(self, uid, task):
+        if self._inflight.get(uid) is task:
+            del self._inflight[uid]
+        # Callers get the exception; mark it retrieved so one nobody awaited isn't logged
+        if not task.cancelled():
+            task.exception()
+
+    async def _sign_in_pool(self, uid):
+        async with self._semaphore:
+            start = time.perf_counter()
+            token = await asyncio.get_running_loop().run_in_executor(self._executor, self._sign, uid)
+            self._latencies.append(time.perf_counter() - start)
+            self.signed += 1
+            return token
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+    def stats(self):
+        latencies = sorted(self._latencies)
+        cache = self._cache.stats()
+        return {
+            **cache,
+            "signed": self.signed,
+            "shared_inflight": self.shared,
+            "sign_ms_avg": round(1000 * sum(latencies) / len(latencies), 2) if latencies else None,
+            "sign_ms_p95": round(1000 * latencies[int(0.95 * (len(latencies) - 1))], 2) if latencies else None,
+            "sign_ms_max": round(1000 * latencies[-1], 2) if latencies else None,
+        }
@@ -0,0 +1,71 @@
+import json
+import sys
+
+import pyarrow.parquet as pq
+
+from geojson_to_parquet import ROW_GROUP_BBOXES_KEY
+
+# Same planar-degree radius the sign queries use
+DEGREES_TO_METERS = 111139
+
+
+def row_group_bboxes(pf: pq.ParquetFile):
+    """
+    Per-row-group [min_lng, min_lat, max_lng, max_lat]. Uses the bounding boxes
+    stored by geojson_to_parquet.py, falling back to the column statistics.
+    """
+    meta = pf.metadata.metadata or {}  # file footer key-values, where add_key_value_metadata writes
+    if ROW_GROUP_BBOXES_KEY in meta:
+        return json.loads(meta[ROW_GROUP_BBOXES_KEY])
+
+    names = pf.schema_arrow.names
+    lat_idx, lng_idx = names.index("shape_lat"), names.index("shape_lng")
+    bboxes = []
+    for i in range(pf.metadata.num_row_groups):
+        rg = pf.metadata.row_group(i)
+        lat_stats, lng_stats = rg.column(lat_idx).statistics, rg.column(lng_idx).statistics
+        if lat_stats is None or lng_stats is None or not lat_stats.has_min_max:
+            bboxes.append([-180, -90, 180, 90])  # no stats, can't prune
+        else:
+            bboxes.append([lng_stats.min, lat_stats.min, lng_stats.max, lat_stats.max])
+    return bboxes
+
+
+def row_groups_for_radius(pf: pq.ParquetFile, lat, lon, radius_meters):
+    """Indexes of the row groups whose bounding box overlaps the query radius."""
+    delta = radius_meters / DEGREES_TO_METERS
+    keep = []
+    for i, bbox in enumerate(row_group_bboxes(pf)):
+        if bbox is None:
+            continue
+        min_lng, min_lat, max_lng, max_lat = bbox
+        if min_lng <= lon + delta and max_lng >= lon - delta and min_lat <= lat + delta and max_lat >= lat - delta:
+            keep.append(i)
+    return keep
+
+
+def read_nearby(parquet_file, lat, lon, radius_meters):
+    """Read only the row groups that can contain points within radius_meters."""
+    pf = pq.ParquetFile(parquet_file)
+    keep = row_groups_for_radius(pf, lat, lon, radius_meters)
+    if not keep:
+        return pf.schema_arrow.empty_table()
+    return pf.read_row_groups(keep)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 5:
+        print("Usage: python check_row_group_pruning.py file.parquet lat lon radius_meters")
+        sys.exit(1)
+
+    parquet_file = sys.argv[1]
+    lat, lon, radius = float(sys.argv[2]), float(sys.argv[3]), float(sys.argv[4])
+
+    pf = pq.ParquetFile(parquet_file)
+    total = pf.metadata.num_row_groups
+    keep = row_groups_for_radius(pf, lat, lon, radius)
+    table = pf.read_row_groups(keep) if keep else pf.schema_arrow.empty_table()
+
+    print(f"Row groups: {total} total, {len(keep)} read, {total - len(keep)} pruned "
+          f"({(total - len(keep)) / max(total, 1):.1%})")
+    print(f"Rows read: {table.num_rows} of {pf.metadata.num_rows}")
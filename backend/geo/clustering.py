@@ -0,0 +1,113 @@
+"""
+Precomputed grid cluster pyramid for viewport queries.
+
+At load time every point is binned into a grid of `cell_px`-pixel cells at each
+zoom level (web-mercator pixel space, 256 px tiles), and each cell becomes one
+cluster with a count and a centroid. A viewport query then only scans the
+clusters of one level, which is a few hundred rows when zoomed out instead of
+every sign in the city. Above max_zoom the raw points are returned.
+"""
+import math
+
+import numpy as np
+
+TILE_SIZE = 256
+
+
+def mercator_xy(lat, lng):
+    """Normalized web-mercator coordinates in [0, 1] (y grows southward)."""
+    lat = np.clip(np.asarray(lat, dtype=float), -85.05112878, 85.05112878)
+    x = (np.asarray(lng, dtype=float) + 180.0) / 360.0
+    sin = np.sin(np.radians(lat))
+    y = 0.5 - np.log((1 + sin) / (1 - sin)) / (4 * math.pi)
+    return x, y
+
+
+class ClusterLevel:
+    """Clusters of one zoom level as parallel numpy arrays."""
+
+    def __init__(self, lat, lng, count, kind_counts, first_index):
+        self.lat = lat
+        self.lng = lng
+        self.count = count
+        self.kind_counts = kind_counts  # {kind: counts array}
+        self.first_index = first_index  # a member point, used when count == 1
+
+
+class ClusterPyramid:
+    def __init__(self, point_sets, min_zoom: int = 0, max_zoom: int = 16, cell_px: int = 64):
+        """
+        point_sets: geo.point_data.PointSet objects (e.g. signs and garages),
+        clustered together but counted per kind.
+        """
+        self.min_zoom = min_zoom
+        self.max_zoom = max_zoom
+        self.cell_px = cell_px
+
+        point_sets = [p for p in point_sets if p is not None]
+        self.lat = np.concatenate([p.lat for p in point_sets]) if point_sets else np.empty(0)
+        self.lng = np.concatenate([p.lng for p in point_sets]) if point_sets else np.empty(0)
+        self.kinds = np.concatenate([np.full(len(p), p.kind, dtype=object) for p in point_sets]) if point_sets else np.empty(0, dtype=object)
+        self.props = [props for p in point_sets for props in p.props]
+        self.kind_names = sorted({p.kind for p in point_sets})
+
+        x, y = mercator_xy(self.lat, self.lng)
+        self.levels = {z: self._build_level(x, y, z) for z in range(min_zoom, max_zoom + 1)}
+
+    def __len__(self):
+        return len(self.lat)
+
+    def _build_level(self, x, y, zoom):
+        cells = (1 << zoom) * TILE_SIZE / self.cell_px
+        ix = np.floor(x * cells).astype(np.int64)
+        iy = np.floor(y * cells).astype(np.int64)
+        keys = ix * (int(cells) + 1) + iy
+
+        _, first_index, inverse, count = np.unique(keys, return_index=True, return_inverse=True, return_counts=True)
+        lat = np.bincount(inverse, weights=self.lat) / count
+        lng = np.bincount(inverse, weights=self.lng) / count
+        kind_counts = {
+            kind: np.bincount(inverse, weights=(self.kinds == kind).astype(float), minlength=len(count)).astype(np.int64)
+            for kind in self.kind_names
+        }
+        return ClusterLevel(lat, lng, count, kind_counts, first_index)
+
+    def _point(self, i):
+        return {"kind": self.kinds[i], "lat": float(self.lat[i]), "lng": float(self.lng[i]), **self.props[i]}
+
+    def query(self, min_lat, min_lng, max_lat, max_lng, zoom, max_results: int = 5000):
+        """
+        Clusters and single points inside the bounding box for the given zoom.
+        Returns {"zoom", "clusters", "points", "truncated"}.
+        """
+        zoom = max(self.min_zoom, int(zoom))
+        if zoom > self.max_zoom:
+            mask = (self.lat >= min_lat) & (self.lat <= max_lat) & (self.lng >= min_lng) & (self.lng <= max_lng)
+            idx = np.flatnonzero(mask)
+            return {
+                "zoom": zoom,
+                "clusters": [],
+                "points": [self._point(i) for i in idx[:max_results]],
+                "truncated": len(idx) > max_results,
+            }
+
+        level = self.levels[zoom]
+        mask = (level.lat >= min_lat) & (level.lat <= max_lat) & (level.lng >= min_lng) & (level.lng <= max_lng)
+        idx = np.flatnonzero(mask)
+        truncated = len(idx) > max_results
+        if truncated:
+            # Keep the biggest clusters
+            idx = idx[np.argsort(-level.count[idx], kind="stable")[:max_results]]
+
+        clusters, points = [], []
+        for i in idx:
+            if level.count[i] == 1:
+                points.append(self._point(level.first_index[i]))
+            else:
+                clusters.append({
+                    "lat": float(level.lat[i]),
+                    "lng": float(level.lng[i]),
+                    "count": int(level.count[i]),
+                    "counts": {kind: int(level.kind_counts[kind][i]) for kind in self.kind_names},
+                })
+        return {"zoom": zoom, "clusters": clusters, "points": points, "truncated": truncated}
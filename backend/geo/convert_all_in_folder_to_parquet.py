@@ -1,29 +1,154 @@
 #!/usr/bin/env python3
+"""
+Convert every JSON / GeoJSON file in a folder to Parquet, in parallel.
+
+A manifest (.parquet_manifest.json in the output folder) records the content
+hash of each input, so unchanged files are skipped on the next run. Outputs are
+written to a temp file and renamed into place, so a crash never leaves a
+half-written Parquet file behind.
+
+Usage:
+    python convert_all_in_folder_to_parquet.py ../data/used ../data/parquet_output [--workers N] [--force]
+"""
+import argparse
+import hashlib
 import json
-import pandas as pd
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 
-# Config
-input_folder = Path("/Users/emilykang/Documents/Projects/caniparkhere-v2/backend/data/used")  # folder containing JSON files
-output_folder = Path("/Users/emilykang/Documents/Projects/caniparkhere-v2/backend/data/parquet_output")
-output_folder.mkdir(parents=True, exist_ok=True)
-
-# Iterate over JSON files
-for json_file in input_folder.glob("*.json"):
-    print(f"Processing {json_file.name}...")
-
-    # Load JSON
-    with open(json_file, "r") as f:
-        try:
-            data = json.load(f)
-        except json.JSONDecodeError as e:
-            print(f"  ❌ Failed to parse {json_file.name}: {e}")
+import pandas as pd
+
+from geojson_to_parquet import convert_geojson_to_parquet
+
+MANIFEST_NAME = ".parquet_manifest.json"
+PATTERNS = ("*.json", "*.geojson")
+
+
+def file_sha256(path: Path, chunk_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def load_manifest(output_folder: Path) -> dict:
+    try:
+        with open(output_folder / MANIFEST_NAME) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_manifest(output_folder: Path, manifest: dict):
+    tmp = output_folder / f"{MANIFEST_NAME}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, output_folder / MANIFEST_NAME)
+
+
+def is_unchanged(json_file: Path, parquet_file: Path, entry: dict) -> bool:
+    """
+    Size + mtime matching the manifest entry is enough to skip without reading
+    the file; otherwise fall back to comparing content hashes.
+    """
+    if not entry or not parquet_file.exists():
+        return False
+    st = json_file.stat()
+    if entry.get("size") == st.st_size and entry.get("mtime_ns") == st.st_mtime_ns:
+        return True
+    if file_sha256(json_file) != entry.get("sha256"):
+        return False
+    # Touched but not changed: remember the new stat so next run takes the fast path
+    entry["size"], entry["mtime_ns"] = st.st_size, st.st_mtime_ns
+    return True
+
+
+def convert_one(json_file: str, parquet_file: str) -> dict:
+    """Convert a single file (runs in a worker process). Returns its manifest entry."""
+    json_file, parquet_file = Path(json_file), Path(parquet_file)
+    start = time.perf_counter()
+    st = json_file.stat()
+    sha = file_sha256(json_file)
+
+    tmp = parquet_file.with_name(f".{parquet_file.name}.{os.getpid()}.tmp")
+    try:
+        with open(json_file, "rb") as f:
+            head = f.read(4096)
+        if b'"FeatureCollection"' in head:
+            # Stream GeoJSON, see geojson_to_parquet.py
+            convert_geojson_to_parquet(str(json_file), str(tmp))
+        else:
+            with open(json_file, "r") as f:
+                data = json.load(f)
+            # Flatten JSON to table if nested
+            df = pd.json_normalize(data)
+            df.to_parquet(tmp, engine="pyarrow", index=False)
+        os.replace(tmp, parquet_file)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+    return {
+        "sha256": sha,
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "output": parquet_file.name,
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+
+
+def convert_folder(input_folder: Path, output_folder: Path, workers: int = None, force: bool = False):
+    output_folder.mkdir(parents=True, exist_ok=True)
+    manifest = load_manifest(output_folder)
+    start = time.perf_counter()
+
+    inputs = sorted({p for pattern in PATTERNS for p in input_folder.glob(pattern)})
+    todo = []
+    skipped = 0
+    for json_file in inputs:
+        parquet_file = output_folder / f"{json_file.stem}.parquet"
+        if not force and is_unchanged(json_file, parquet_file, manifest.get(json_file.name)):
+            skipped += 1
             continue
+        todo.append((json_file, parquet_file))
+
+    print(f"{len(inputs)} input files, {skipped} unchanged, {len(todo)} to convert")
+
+    failed = 0
+    if todo:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(convert_one, str(j), str(p)): j for j, p in todo}
+            for future in as_completed(futures):
+                json_file = futures[future]
+                try:
+                    entry = future.result()
+                except Exception as e:
+                    failed += 1
+                    print(f"  ❌ Failed to convert {json_file.name}: {e}")
+                    continue
+                manifest[json_file.name] = entry
+                # Save as we go so an interrupted run still skips what finished
+                save_manifest(output_folder, manifest)
+                print(f"  ✅ Saved {entry['output']} in {entry['seconds']:.2f}s")
+
+    # Forget inputs that no longer exist
+    names = {p.name for p in inputs}
+    for name in [n for n in manifest if n not in names]:
+        del manifest[name]
+    save_manifest(output_folder, manifest)
+
+    print(f"Done in {time.perf_counter() - start:.2f}s ({len(todo) - failed} converted, {skipped} skipped, {failed} failed)")
+    return failed
+
 
-    # Flatten JSON to table if nested
-    df = pd.json_normalize(data)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert a folder of JSON/GeoJSON files to Parquet")
+    parser.add_argument("input_folder", type=Path, help="folder containing JSON files")
+    parser.add_argument("output_folder", type=Path, help="folder for the Parquet output and manifest")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--force", action="store_true", help="reconvert everything, ignoring the manifest")
+    args = parser.parse_args()
 
-    # Save to Parquet
-    parquet_file = output_folder / f"{json_file.stem}.parquet"
-    df.to_parquet(parquet_file, engine="pyarrow", index=False)
-    print(f"  ✅ Saved {parquet_file.name}")
\ No newline at end of file
+    raise SystemExit(1 if convert_folder(args.input_folder, args.output_folder, args.workers, args.force) else 0)
@@ -1,49 +1,266 @@
-import pandas as pd
-import pyarrow as pa
-import pyarrow.parquet as pq
+import argparse
 import json
+import resource
 import sys
+import time
+
+import ijson
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+# Features per Arrow record batch, which is also one Parquet row group
+DEFAULT_BATCH_SIZE = 50_000
+# Smaller row groups when sorting spatially: each one then covers a few blocks, not the whole city
+DEFAULT_SORTED_ROW_GROUP_SIZE = 8_192
+# File metadata key holding [min_lng, min_lat, max_lng, max_lat] per row group
+ROW_GROUP_BBOXES_KEY = b"caniparkhere:row_group_bboxes"
+
+
+def _peak_rss_mb():
+    # ru_maxrss is KB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def set_shape_coords(props, lng, lat):
+    """
+    Put point coordinates in shape_lat / shape_lng. If the properties already
+    carry them under another case (e.g. SHAPE_LAT) that value wins, like the
+    first-column-wins duplicate handling below.
+    """
+    existing = {k.lower(): k for k in props}
+    for col, value in (("shape_lat", lat), ("shape_lng", lng)):
+        key = existing.get(col)
+        props[col] = props.pop(key) if key is not None else value
+    return props
+
+
+def iter_feature_rows(input_file):
+    """
+    Yield one flat dict per feature, streaming the GeoJSON instead of json.load-ing it.
+    Point coordinates end up in shape_lat / shape_lng.
+    """
+    with open(input_file, "rb") as f:
+        for feature in ijson.items(f, "features.item", use_float=True):
+            props = feature.get("properties") or {}
+            geom = feature.get("geometry") or {}
+            # Assuming POINT geometries
+            lng, lat = geom.get("coordinates") or (None, None)
+            yield set_shape_coords(props, lng, lat)
+
+
+def infer_schema(rows):
+    """
+    Build the fixed output schema from a sample of rows.
+
+    - Duplicate columns (case-insensitive) are dropped, first one wins.
+    - shape_lat / shape_lng go last, as float64.
+    - Columns that are all null in the sample are typed as strings.
+    - Properties that only show up after the sample are dropped.
+    """
+    seen = set()
+    cols = []
+    for row in rows:
+        for col in row:
+            lower = col.lower()
+            if lower not in seen and col not in ("shape_lat", "shape_lng"):
+                cols.append(col)
+                seen.add(lower)
+
+    fields = []
+    for col in cols:
+        arr_type = pa.array([row.get(col) for row in rows]).type
+        fields.append(pa.field(col, pa.string() if pa.types.is_null(arr_type) else arr_type))
+    fields += [pa.field("shape_lat", pa.float64()), pa.field("shape_lng", pa.float64())]
+    return pa.schema(fields)
+
+
+def rows_to_batch(rows, schema):
+    """Convert a list of row dicts into a RecordBatch with exactly `schema`."""
+    arrays = []
+    for field in schema:
+        values = [row.get(field.name) for row in rows]
+        try:
+            arrays.append(pa.array(values, type=field.type))
+        except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError):
+            if not pa.types.is_string(field.type):
+                raise ValueError(
+                    f"Column {field.name!r} does not fit type {field.type} inferred from the first batch; "
+                    "try a larger batch size"
+                )
+            arrays.append(pa.array([None if v is None else str(v) for v in values], type=field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def iter_record_batches(input_file, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Stream features into Arrow record batches of at most batch_size rows.
+    The schema is fixed from the first batch; returns (schema, batch iterator).
+    """
+    rows_iter = iter_feature_rows(input_file)
+
+    def take():
+        batch = []
+        for row in rows_iter:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                break
+        return batch
+
+    first = take()
+    schema = infer_schema(first) if first else pa.schema([("shape_lat", pa.float64()), ("shape_lng", pa.float64())])
+
+    def batches():
+        rows = first
+        while rows:
+            yield rows_to_batch(rows, schema)
+            rows = take()
+
+    return schema, batches()
+
+
+def _quantize(values, lo, hi, order):
+    """Scale floats in [lo, hi] onto the integer grid [0, 2**order - 1]."""
+    n = (1 << order) - 1
+    span = (hi - lo) or 1.0
+    return np.clip((values - lo) / span * n, 0, n).astype(np.uint64)
+
+
+def hilbert_key(x, y, order=16):
+    """Vectorized Hilbert curve index of integer grid coordinates (xy2d)."""
+    x = x.astype(np.uint64).copy()
+    y = y.astype(np.uint64).copy()
+    n = np.uint64((1 << order) - 1)
+    d = np.zeros(len(x), dtype=np.uint64)
+    s = 1 << (order - 1)
+    while s > 0:
+        s64 = np.uint64(s)
+        rx = (x & s64) > 0
+        ry = (y & s64) > 0
+        d += s64 * s64 * ((np.uint64(3) * rx.astype(np.uint64)) ^ ry.astype(np.uint64))
+        # Rotate the quadrant so the curve stays continuous
+        flip = ~ry & rx
+        x = np.where(flip, n - x, x)
+        y = np.where(flip, n - y, y)
+        swap = ~ry
+        x, y = np.where(swap, y, x), np.where(swap, x, y)
+        s >>= 1
+    return d
+
+
+def zorder_key(x, y, order=16):
+    """Vectorized Z-order (Morton) index: interleave the bits of x and y."""
+    x = x.astype(np.uint64)
+    y = y.astype(np.uint64)
+    d = np.zeros(len(x), dtype=np.uint64)
+    for bit in range(order):
+        b = np.uint64(bit)
+        d |= ((x >> b) & np.uint64(1)) << np.uint64(2 * bit)
+        d |= ((y >> b) & np.uint64(1)) << np.uint64(2 * bit + 1)
+    return d
+
+
+SORT_KEYS = {"hilbert": hilbert_key, "zorder": zorder_key}
+
+
+def spatial_sort(table, method="hilbert", order=16):
+    """Sort a table by a space-filling curve over shape_lng / shape_lat. Rows without coordinates go last."""
+    lng = table.column("shape_lng").to_numpy(zero_copy_only=False).astype(float)
+    lat = table.column("shape_lat").to_numpy(zero_copy_only=False).astype(float)
+    valid = ~(np.isnan(lng) | np.isnan(lat))
+    if not valid.any():
+        return table
+
+    x = _quantize(np.where(valid, lng, 0), lng[valid].min(), lng[valid].max(), order)
+    y = _quantize(np.where(valid, lat, 0), lat[valid].min(), lat[valid].max(), order)
+    keys = SORT_KEYS[method](x, y, order)
+    keys[~valid] = np.iinfo(np.uint64).max
+    return table.take(pa.array(np.argsort(keys, kind="stable")))
+
+
+def row_group_bbox(batch):
+    """[min_lng, min_lat, max_lng, max_lat] of a batch/table, or None if it has no coordinates."""
+    lng = pc.min_max(batch.column("shape_lng"))
+    lat = pc.min_max(batch.column("shape_lat"))
+    if not lng["min"].is_valid or not lat["min"].is_valid:
+        return None
+    return [lng["min"].as_py(), lat["min"].as_py(), lng["max"].as_py(), lat["max"].as_py()]
+
+
+def convert_geojson_to_parquet(
+    input_file,
+    output_file,
+    batch_size=DEFAULT_BATCH_SIZE,
+    compression="SNAPPY",
+    sort=None,
+    row_group_size=None,
+):
+    """
+    Convert a GeoJSON FeatureCollection of points to Parquet.
+
+    Without `sort` this runs in constant memory: each batch is written out as
+    its own row group as soon as it is parsed.
+
+    With sort="hilbert" or "zorder" rows are ordered along a space-filling curve
+    so each row group covers a small area and its shape_lat/shape_lng min/max
+    statistics become useful for pruning. That needs the whole dataset in Arrow
+    (still far smaller than the parsed JSON), then it is written in row groups of
+    `row_group_size` rows.
+
+    Either way the per-row-group bounding boxes are stored in the file metadata
+    under ROW_GROUP_BBOXES_KEY. Returns a dict of throughput stats.
+    """
+    start = time.perf_counter()
+    n_rows = 0
+    bboxes = []
+
+    schema, batches = iter_record_batches(input_file, batch_size=batch_size)
+    if sort:
+        table = spatial_sort(pa.Table.from_batches(list(batches), schema=schema), method=sort)
+        row_group_size = row_group_size or DEFAULT_SORTED_ROW_GROUP_SIZE
+        batches = (table.slice(offset, row_group_size) for offset in range(0, table.num_rows, row_group_size))
+    else:
+        row_group_size = row_group_size or batch_size
+
+    with pq.ParquetWriter(output_file, schema, compression=compression) as writer:
+        for batch in batches:
+            # Anything up to row_group_size rows becomes exactly one row group
+            for offset in range(0, batch.num_rows, row_group_size):
+                chunk = batch.slice(offset, row_group_size)
+                writer.write(chunk, row_group_size=row_group_size)
+                bboxes.append(row_group_bbox(chunk))
+                n_rows += chunk.num_rows
+        writer.add_key_value_metadata({ROW_GROUP_BBOXES_KEY: json.dumps(bboxes).encode()})
+
+    elapsed = time.perf_counter() - start
+    return {
+        "rows": n_rows,
+        "row_groups": len(bboxes),
+        "seconds": elapsed,
+        "rows_per_second": n_rows / elapsed if elapsed else 0.0,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert a GeoJSON FeatureCollection of points to Parquet")
+    parser.add_argument("input_file")
+    parser.add_argument("output_file")
+    parser.add_argument("batch_size", nargs="?", type=int, default=DEFAULT_BATCH_SIZE, help="features parsed per batch")
+    parser.add_argument("--sort", choices=sorted(SORT_KEYS), default=None, help="order rows along a space-filling curve")
+    parser.add_argument("--row-group-size", type=int, default=None, help="rows per row group")
+    args = parser.parse_args()
+
+    stats = convert_geojson_to_parquet(
+        args.input_file, args.output_file,
+        batch_size=args.batch_size, sort=args.sort, row_group_size=args.row_group_size,
+    )
 
-if len(sys.argv) != 3:
-    print("Usage: python convert_geojson_to_parquet_clean.py input.json output.parquet")
-    sys.exit(1)
-
-input_file = sys.argv[1]
-output_file = sys.argv[2]
-
-# --- Load GeoJSON ---
-with open(input_file) as f:
-    geojson = json.load(f)
-
-# --- Flatten features into DataFrame ---
-rows = []
-for feature in geojson["features"]:
-    props = feature["properties"]
-    geom = feature["geometry"]
-    # Assuming POINT geometries
-    lng, lat = geom["coordinates"]
-    props["shape_lat"] = lat
-    props["shape_lng"] = lng
-    rows.append(props)
-
-df = pd.DataFrame(rows)
-
-# --- Remove duplicate columns (case-insensitive) ---
-seen = set()
-unique_cols = []
-for col in df.columns:
-    lower = col.lower()
-    if lower not in seen:
-        unique_cols.append(col)
-        seen.add(lower)
-df = df[unique_cols]
-
-# Optional: reorder columns (geometry last)
-cols = [c for c in df.columns if c not in ("shape_lat", "shape_lng")] + ["shape_lat", "shape_lng"]
-df = df[[c for c in cols if c in df.columns]]  # only keep columns that exist
-
-# --- Convert to Parquet ---
-table = pa.Table.from_pandas(df)
-pq.write_table(table, output_file, compression="SNAPPY")
-
-print(f"Clean Parquet file ready: {output_file}")
+    print(f"Clean Parquet file ready: {args.output_file}")
+    print(
+        f"{stats['rows']} rows in {stats['row_groups']} row groups, "
+        f"{stats['seconds']:.1f}s ({stats['rows_per_second']:.0f} rows/s), "
+        f"peak RSS {stats['peak_rss_mb']:.0f} MB"
+    )
@@ -1,53 +1,263 @@
 #!/usr/bin/env python3
-import sys
-import tempfile
+"""
+Stream a GeoJSON (EPSG:3857 by default) into Parquet (EPSG:4326) on S3.
+
+Features are parsed incrementally, reprojected a whole batch at a time with a
+cached pyproj Transformer, and each batch becomes a Parquet row group that is
+written straight into a concurrent S3 multipart upload - no temp file on disk.
+
+Test against a local S3 stand-in (MinIO, moto_server, ...) with --endpoint-url:
+    python geojson_to_parquet_s3.py ../data/sdot_street_signs_3857.geojson s3://bucket/signs.parquet \\
+        --endpoint-url http://localhost:9000 --part-size-mb 8 --concurrency 4
+"""
+import argparse
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
 import boto3
-import geopandas as gpd
+import ijson
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import shapely
+from pyproj import CRS, Transformer
+
+from geojson_to_parquet import DEFAULT_BATCH_SIZE, infer_schema, rows_to_batch, set_shape_coords
+
+MIN_PART_SIZE = 5 * 1024 * 1024  # S3 minimum for every part but the last
+
+
+@lru_cache(maxsize=None)
+def get_transformer(src_crs: str, dst_crs: str) -> Transformer:
+    """Building a Transformer is expensive; build each CRS pair once."""
+    return Transformer.from_crs(src_crs, dst_crs, always_xy=True)
+
+
+def reproject(geoms: np.ndarray, src_crs: str, dst_crs: str) -> np.ndarray:
+    """Reproject an array of shapely geometries in one vectorized pass over all their coordinates."""
+    if src_crs == dst_crs:
+        return geoms
+    transformer = get_transformer(src_crs, dst_crs)
+
+    def _transform(coords):
+        x, y = transformer.transform(coords[:, 0], coords[:, 1])
+        return np.column_stack([x, y])
 
-def geojson_to_parquet_s3(input_geojson_path, s3_uri, drop_columns=None, aws_profile=None):
+    return shapely.transform(geoms, _transform)
+
+
+class S3MultipartWriter:
     """
-    Convert a GeoJSON (EPSG:3857) to Parquet (EPSG:4326),
-    drop duplicate or unneeded columns, and upload to S3.
+    Minimal writable file object backed by an S3 multipart upload.
+
+    Bytes are buffered until part_size, then each part is uploaded from a thread
+    pool. At most `concurrency` parts are in flight, so memory stays around
+    part_size * (concurrency + 1). Call abort() on failure; close() completes.
     """
-    # Load GeoJSON
-    gdf = gpd.read_file(input_geojson_path)
-
-    # Reproject to WGS84
-    gdf = gdf.to_crs(epsg=4326)
-
-    # Drop duplicate columns (case-insensitive)
-    seen = set()
-    keep_cols = []
-    for c in gdf.columns:
-        cl = c.lower()
-        if cl not in seen:
-            seen.add(cl)
-            keep_cols.append(c)
-    gdf = gdf[keep_cols]
-
-    # Drop specified columns
-    if drop_columns:
-        gdf = gdf.drop(columns=drop_columns, errors="ignore")
 
+    def __init__(self, s3, bucket, key, part_size=8 * 1024 * 1024, concurrency=4):
+        if part_size < MIN_PART_SIZE:
+            raise ValueError(f"part_size must be at least {MIN_PART_SIZE} bytes")
+        self.s3 = s3
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.upload_id = s3.create_multipart_upload(Bucket=bucket, Key=key)["UploadId"]
+        self._buffer = bytearray()
+        self._position = 0
+        self._parts = []
+        self._futures = []
+        self._pool = ThreadPoolExecutor(max_workers=concurrency)
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._closed = False
+
+    # file-like interface used by pyarrow
+    @property
+    def closed(self):
+        return self._closed
+
+    def writable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def write(self, data):
+        self._buffer += data
+        self._position += len(data)
+        while len(self._buffer) >= self.part_size:
+            self._submit(bytes(self._buffer[:self.part_size]))
+            del self._buffer[:self.part_size]
+        return len(data)
+
+    def _submit(self, body):
+        part_number = len(self._futures) + 1
+        self._slots.acquire()  # backpressure: wait for a free upload slot
+        future = self._pool.submit(self._upload_part, part_number, body)
+        future.add_done_callback(lambda _: self._slots.release())
+        self._futures.append(future)
+
+    def _upload_part(self, part_number, body):
+        resp = self.s3.upload_part(
+            Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+            PartNumber=part_number, Body=body,
+        )
+        return {"PartNumber": part_number, "ETag": resp["ETag"]}
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            if self._buffer or not self._futures:
+                self._submit(bytes(self._buffer))
+                self._buffer.clear()
+            parts = [f.result() for f in self._futures]
+            self.s3.complete_multipart_upload(
+                Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                MultipartUpload={"Parts": parts},
+            )
+        except Exception:
+            self.abort()
+            raise
+        finally:
+            self._pool.shutdown(wait=True)
+
+    def abort(self):
+        self._closed = True
+        for f in self._futures:
+            f.cancel()
+        self._pool.shutdown(wait=True)
+        self.s3.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+
+
+def iter_feature_batches(input_geojson_path, batch_size):
+    """Yield lists of (properties, geometry) pairs, streaming the GeoJSON."""
+    batch = []
+    with open(input_geojson_path, "rb") as f:
+        for feature in ijson.items(f, "features.item", use_float=True):
+            batch.append((feature.get("properties") or {}, feature.get("geometry")))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def features_to_rows(features, src_crs, dst_crs, drop_columns):
+    """Reproject a batch of features and return (rows, geometry WKB list)."""
+    geoms = shapely.from_geojson([json.dumps(g) if g else None for _, g in features])
+    geoms = reproject(geoms, src_crs, dst_crs)
+
+    is_point = shapely.get_type_id(geoms) == 0
+    xs = np.where(is_point, shapely.get_x(geoms), np.nan)
+    ys = np.where(is_point, shapely.get_y(geoms), np.nan)
+
+    drop = {c.lower() for c in (drop_columns or [])}
+    rows = []
+    for (props, _), x, y in zip(features, xs, ys):
+        props = {k: v for k, v in props.items() if k.lower() not in drop}
+        rows.append(set_shape_coords(
+            props,
+            None if np.isnan(x) else float(x),
+            None if np.isnan(y) else float(y),
+        ))
+    return rows, shapely.to_wkb(geoms).tolist()
+
+
+def geojson_to_parquet_s3(
+    input_geojson_path,
+    s3_uri,
+    drop_columns=None,
+    aws_profile=None,
+    src_crs="EPSG:3857",
+    dst_crs="EPSG:4326",
+    batch_size=DEFAULT_BATCH_SIZE,
+    part_size=8 * 1024 * 1024,
+    concurrency=4,
+    endpoint_url=None,
+):
+    """
+    Convert a GeoJSON (EPSG:3857) to Parquet (EPSG:4326),
+    drop duplicate or unneeded columns, and stream it to S3.
+    """
     # Parse S3 URI
     if not s3_uri.startswith("s3://"):
         raise ValueError("S3 URI must start with s3://")
     s3_path = s3_uri[5:]
     bucket, key = s3_path.split("/", 1)
 
-    # Upload to S3
     session = boto3.Session(profile_name=aws_profile) if aws_profile else boto3.Session()
-    s3 = session.client("s3")
+    s3 = session.client("s3", endpoint_url=endpoint_url)
+
+    start = time.perf_counter()
+    n_rows = 0
+    schema = None
+    writer = None
+    sink = S3MultipartWriter(s3, bucket, key, part_size=part_size, concurrency=concurrency)
+    try:
+        for features in iter_feature_batches(input_geojson_path, batch_size):
+            rows, wkb = features_to_rows(features, src_crs, dst_crs, drop_columns)
+            if schema is None:
+                # Fixed schema from the first batch (duplicate columns dropped), plus WKB geometry
+                geo_meta = {
+                    "version": "1.0.0",
+                    "primary_column": "geometry",
+                    "columns": {"geometry": {"encoding": "WKB", "geometry_types": [], "crs": CRS(dst_crs).to_json_dict()}},
+                }
+                schema = infer_schema(rows).append(pa.field("geometry", pa.binary()))
+                schema = schema.with_metadata({b"geo": json.dumps(geo_meta).encode()})
+                writer = pq.ParquetWriter(sink, schema, compression="SNAPPY")
+
+            batch = rows_to_batch(rows, schema.remove(schema.get_field_index("geometry")))
+            batch = pa.RecordBatch.from_arrays(
+                batch.columns + [pa.array(wkb, type=pa.binary())], schema=schema
+            )
+            writer.write_batch(batch, row_group_size=batch_size)
+            n_rows += batch.num_rows
+        if writer is None:
+            raise ValueError(f"No features found in {input_geojson_path}")
+        writer.close()
+        sink.close()
+    except BaseException:
+        if not sink.closed:
+            sink.abort()
+        raise
+
+    elapsed = time.perf_counter() - start
+    print(f"Uploaded {n_rows} rows to {s3_uri} in {elapsed:.1f}s ({n_rows / max(elapsed, 1e-9):.0f} rows/s)")
+    return n_rows
 
-    with tempfile.NamedTemporaryFile(suffix=".parquet") as tmp:
-        gdf.to_parquet(tmp.name, engine="pyarrow", index=False)
-        print(f"Parquet written locally: {tmp.name}")
-        s3.upload_file(tmp.name, bucket, key)
-        print(f"Uploaded to {s3_uri}")
 
 if __name__ == "__main__":
-    if len(sys.argv) != 3:
-        print("Usage: python geojson_to_parquet_s3.py <input_geojson> <s3_uri>")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Stream a GeoJSON into Parquet on S3")
+    parser.add_argument("input_geojson")
+    parser.add_argument("s3_uri")
+    parser.add_argument("--src-crs", default="EPSG:3857")
+    parser.add_argument("--dst-crs", default="EPSG:4326")
+    parser.add_argument("--drop-columns", nargs="*", default=["SE_ANNO_CAD_DATA"])
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="features per row group")
+    parser.add_argument("--part-size-mb", type=int, default=8, help="multipart upload part size (min 5)")
+    parser.add_argument("--concurrency", type=int, default=4, help="parts uploaded in parallel")
+    parser.add_argument("--profile", default=None, help="AWS profile name")
+    parser.add_argument("--endpoint-url", default=None, help="S3 endpoint, e.g. a local MinIO")
+    args = parser.parse_args()
 
-    geojson_to_parquet_s3(sys.argv[1], sys.argv[2], drop_columns=["SE_ANNO_CAD_DATA"])
+    geojson_to_parquet_s3(
+        args.input_geojson,
+        args.s3_uri,
+        drop_columns=args.drop_columns,
+        aws_profile=args.profile,
+        src_crs=args.src_crs,
+        dst_crs=args.dst_crs,
+        batch_size=args.batch_size,
+        part_size=args.part_size_mb * 1024 * 1024,
+        concurrency=args.concurrency,
+        endpoint_url=args.endpoint_url,
+    )
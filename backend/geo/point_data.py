@@ -0,0 +1,102 @@
+"""
+Flat point arrays for the sign and garage datasets.
+
+The map-facing indexes (viewport clusters, vector tiles, location checks) all
+want the same thing: every feature as a lat/lng pair plus a few display
+properties. They can be loaded from the Parquet files we ship to Athena or
+taken from the local backend's current snapshot.
+"""
+import os
+
+import numpy as np
+import pyarrow.parquet as pq
+import shapely
+
+SIGNS_PARQUET_PATH = os.getenv("SIGNS_PARQUET_PATH", "./data/SDOT_STREET_SIGNS.parquet")
+GARAGES_PARQUET_PATH = os.getenv("GARAGES_PARQUET_PATH", "./data/public_garages_and_parking_lots.parquet")
+
+SIGN_PROPS = ("category", "text")
+GARAGE_PROPS = ("dea_facility_address",)
+
+
+class PointSet:
+    """Parallel arrays of lat, lng and per-point property dicts for one dataset."""
+
+    def __init__(self, kind: str, lat, lng, props: list):
+        self.kind = kind
+        self.lat = np.asarray(lat, dtype=float)
+        self.lng = np.asarray(lng, dtype=float)
+        self.props = props
+
+    def __len__(self):
+        return len(self.lat)
+
+    def filter(self, mask) -> "PointSet":
+        idx = np.flatnonzero(mask)
+        return PointSet(self.kind, self.lat[idx], self.lng[idx], [self.props[i] for i in idx])
+
+
+def _lower_columns(table):
+    return table.rename_columns([c.lower() for c in table.column_names])
+
+
+def load_sign_points(path: str = SIGNS_PARQUET_PATH, categories=None) -> PointSet:
+    """Signs from the clean Parquet file (shape_lat / shape_lng columns)."""
+    table = _lower_columns(pq.read_table(path))
+    cols = [c for c in SIGN_PROPS if c in table.column_names]
+    props = table.select(cols).to_pylist()
+    points = PointSet(
+        "sign",
+        table.column("shape_lat").to_numpy(zero_copy_only=False),
+        table.column("shape_lng").to_numpy(zero_copy_only=False),
+        props,
+    )
+    return _finish_signs(points, categories)
+
+
+def load_garage_points(path: str = GARAGES_PARQUET_PATH) -> PointSet:
+    """Garages from Parquet with a WKB geometry column, reduced to their centroids."""
+    table = _lower_columns(pq.read_table(path))
+    centroids = shapely.centroid(shapely.from_wkb(table.column("geometry").to_numpy(zero_copy_only=False)))
+    cols = [c for c in GARAGE_PROPS if c in table.column_names]
+    props = [{"address": row.get("dea_facility_address")} for row in table.select(cols).to_pylist()]
+    return _finish(PointSet("garage", shapely.get_y(centroids), shapely.get_x(centroids), props))
+
+
+def points_from_snapshot(snapshot, categories=None):
+    """(signs, garages) PointSets from a geo.spatial_query_local Snapshot."""
+    def to_points(kind, gdf, prop_cols):
+        centroids = gdf.geometry.centroid.to_crs(epsg=4326)
+        cols = [c for c in prop_cols if c in gdf.columns]
+        props = gdf[cols].astype(object).where(gdf[cols].notna(), None).to_dict("records")
+        return PointSet(kind, centroids.y.values, centroids.x.values, props)
+
+    signs = _finish_signs(to_points("sign", snapshot.datasets["signs"], SIGN_PROPS), categories)
+    garages = to_points("garage", snapshot.datasets["garages"], GARAGE_PROPS)
+    garages.props = [{"address": p.get("dea_facility_address")} for p in garages.props]
+    return signs, _finish(garages)
+
+
+def _finish(points: PointSet) -> PointSet:
+    # Drop features without usable coordinates
+    return points.filter(np.isfinite(points.lat) & np.isfinite(points.lng))
+
+
+def _finish_signs(points: PointSet, categories) -> PointSet:
+    points = _finish(points)
+    if categories is not None:
+        categories = set(categories)
+        points = points.filter(np.array([p.get("category") in categories for p in points.props], dtype=bool))
+    return points
+
+
+def load_points(snapshot=None, categories=None):
+    """
+    (signs, garages) from the local snapshot if there is one, otherwise from the
+    Parquet files. Returns (None, None) if neither source is available.
+    """
+    if snapshot is not None and "signs" in snapshot.datasets and "garages" in snapshot.datasets:
+        return points_from_snapshot(snapshot, categories)
+    if os.path.exists(SIGNS_PARQUET_PATH) and os.path.exists(GARAGES_PARQUET_PATH):
+        return load_sign_points(categories=categories), load_garage_points()
+    return None, None
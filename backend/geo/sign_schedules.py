@@ -0,0 +1,312 @@
+"""
+Rule-based "can I park here now" engine over the SDOT sign dataset.
+
+Each sign's free-text `text` (e.g. "2 HR PARKING 7AM-6PM EXCEPT SUNDAY") is
+parsed once per distinct text when the engine is built from the loaded data
+(at startup and after every dataset swap, never per request) into a weekly
+schedule of 15-minute buckets (7 * 96 = 672). Identical texts share one schedule row, so the whole
+dataset is a small (n_schedules, 672) table plus one schedule id per sign.
+Answering a request is then a grid lookup for nearby signs and one array
+index per sign - no LLM call.
+"""
+import math
+import re
+from functools import lru_cache
+
+import numpy as np
+
+BUCKET_MINUTES = 15
+BUCKETS_PER_DAY = 24 * 60 // BUCKET_MINUTES
+BUCKETS_PER_WEEK = 7 * BUCKETS_PER_DAY
+
+# Status codes, ordered by how restrictive they are
+UNRESTRICTED, PAID, TIME_LIMITED, UNKNOWN, NO_PARKING = 0, 1, 2, 3, 4
+STATUS_NAMES = {
+    UNRESTRICTED: "unrestricted",
+    PAID: "paid",
+    TIME_LIMITED: "time_limited",
+    UNKNOWN: "unknown",
+    NO_PARKING: "no_parking",
+}
+
+DAYS = {"MON": 0, "TUE": 1, "WED": 2, "THU": 3, "FRI": 4, "SAT": 5, "SUN": 6}
+# Only real day spellings, bounded on the right, so MONTHLY or SATELLITE isn't a day
+_DAY = r"(MON|TUE|WED|THU|FRI|SAT|SUN)(?:DAY|SDAY|S|NESDAY|R|RS|RSDAY|URDAY)?S?\b\.?"
+_TIME = r"(\d{1,2})(?::(\d{2}))?\s*(AM|PM|A\.M\.|P\.M\.|A|P)?|(NOON|MIDNIGHT)"
+TIME_RANGE_RE = re.compile(rf"(?:{_TIME})\s*(?:-|–|TO)\s*(?:{_TIME})")
+DAY_RANGE_RE = re.compile(rf"{_DAY}\s*(?:-|–|THRU|THROUGH|TO)\s*{_DAY}")
+DAY_RE = re.compile(rf"\b{_DAY}")
+EXCEPT_RE = re.compile(rf"EXCEPT\s+((?:{_DAY}[\s,&]*(?:AND\s+)?)+)")
+LIMIT_RE = re.compile(r"(\d+(?:\.\d+)?|ONE|TWO|THREE|FOUR)\s*(?:-\s*)?(HR|HOUR|MIN|MINUTE)S?\b")
+WORD_NUMBERS = {"ONE": 1, "TWO": 2, "THREE": 3, "FOUR": 4}
+
+
+def _to_minutes(hour, minute, meridiem, word):
+    if word == "NOON":
+        return 12 * 60
+    if word == "MIDNIGHT":
+        return 0
+    hour, minute = int(hour), int(minute or 0)
+    meridiem = (meridiem or "").replace(".", "")
+    if meridiem.startswith("P") and hour != 12:
+        hour += 12
+    elif meridiem.startswith("A") and hour == 12:
+        hour = 0
+    return (hour % 24) * 60 + minute
+
+
+def _parse_days(text):
+    """Set of weekday numbers (Mon=0) the sign applies to."""
+    days = set()
+    for start, end in DAY_RANGE_RE.findall(text):
+        d = DAYS[start]
+        while True:
+            days.add(d)
+            if d == DAYS[end]:
+                break
+            d = (d + 1) % 7
+    if not days:
+        days = {DAYS[d] for d in DAY_RE.findall(EXCEPT_RE.sub("", text))}
+    if not days or "DAILY" in text:
+        days = set(range(7))
+    for excluded in EXCEPT_RE.findall(text):
+        days -= {DAYS[d] for d in DAY_RE.findall(excluded[0])}
+    return days
+
+
+@lru_cache(maxsize=None)
+def parse_sign_text(text: str):
+    """
+    Parse sign text into a rule dict, or None if it is not a parking rule we understand.
+    Rule keys: status, days (set of weekdays), windows (list of (start, end) minutes,
+    empty = all day), limit_minutes.
+    """
+    if not text:
+        return None
+    t = " ".join(str(text).upper().split())
+
+    if "NO PARKING" in t or "NO STOPPING" in t or "TOW AWAY" in t or "LOAD ZONE" in t or "LOADING ZONE" in t:
+        status = NO_PARKING
+    elif LIMIT_RE.search(t) and "PARK" in t:
+        status = TIME_LIMITED
+    elif "PAY" in t or "PAID" in t or "METER" in t:
+        status = PAID
+    else:
+        return None
+
+    limit_minutes = None
+    if status == TIME_LIMITED:
+        amount, unit = LIMIT_RE.search(t).groups()
+        amount = WORD_NUMBERS.get(amount) or float(amount)
+        limit_minutes = int(amount * 60) if unit.startswith("H") else int(amount)
+
+    # Every posted window counts, e.g. "7AM-9AM 4PM-6PM" peak-hour signs
+    windows = [_parse_range(m) for m in TIME_RANGE_RE.finditer(t)]
+    if not windows and "ANYTIME" not in t and "AT ALL TIMES" not in t and status != NO_PARKING:
+        # Limit or payment without posted hours: we can't tell when it applies
+        return {"status": UNKNOWN, "days": set(range(7)), "windows": [], "limit_minutes": limit_minutes}
+
+    return {"status": status, "days": _parse_days(t), "windows": windows, "limit_minutes": limit_minutes}
+
+
+def _parse_range(m):
+    """(start, end) minutes for one TIME_RANGE_RE match."""
+    start = _to_minutes(*m.groups()[0:4])
+    end = _to_minutes(*m.groups()[4:8])
+    # "7-9AM" style: the start takes the end's meridiem if that keeps it before the end,
+    # otherwise the opposite one ("8-6PM" is 8AM-6PM, "11-2PM" is 11AM-2PM)
+    if m.group(3) is None and m.group(4) is None and m.group(7):
+        start = _to_minutes(m.group(1), m.group(2), m.group(7), None)
+        if start >= end:
+            opposite = "AM" if m.group(7).startswith("P") else "PM"
+            start = _to_minutes(m.group(1), m.group(2), opposite, None)
+    return start, end
+
+
+def schedule_buckets(rule):
+    """672 status codes (one per 15 minutes, Monday 00:00 first) for a parsed rule."""
+    week = np.zeros(BUCKETS_PER_WEEK, dtype=np.uint8)
+    if rule is None:
+        return week
+    for day in rule["days"]:
+        base = day * BUCKETS_PER_DAY
+        if not rule["windows"]:
+            week[base:base + BUCKETS_PER_DAY] = rule["status"]
+            continue
+        for start, end in rule["windows"]:
+            start_b = start // BUCKET_MINUTES
+            end_b = math.ceil(end / BUCKET_MINUTES) or BUCKETS_PER_DAY
+            if end_b > start_b:
+                week[base + start_b:base + end_b] = rule["status"]
+            else:
+                # Overnight, e.g. 10PM-6AM: runs into the next day
+                week[base + start_b:base + BUCKETS_PER_DAY] = rule["status"]
+                nxt = ((day + 1) % 7) * BUCKETS_PER_DAY
+                week[nxt:nxt + end_b] = rule["status"]
+    return week
+
+
+def _window_end(rule, when):
+    """End (minutes) of the rule's window that contains `when`, or None."""
+    if not rule:
+        return None
+    minute = when.hour * 60 + when.minute
+    for start, end in rule["windows"]:
+        inside = start <= minute < end if start < end else (minute >= start or minute < end)
+        if inside:
+            return end
+    return None
+
+
+def time_bucket(when) -> int:
+    return when.weekday() * BUCKETS_PER_DAY + (when.hour * 60 + when.minute) // BUCKET_MINUTES
+
+
+def _format_minutes(minutes):
+    h, m = divmod(minutes % (24 * 60), 60)
+    suffix = "AM" if h < 12 else "PM"
+    h = h % 12 or 12
+    return f"{h}:{m:02d}{suffix}" if m else f"{h}{suffix}"
+
+
+class LocationEngine:
+    def __init__(self, signs, cell_degrees: float = 0.001):
+        """signs: geo.point_data.PointSet with `text` (and `category`) props."""
+        texts = [p.get("text") for p in signs.props]
+        rules = [parse_sign_text(t) for t in texts]
+        applicable = np.array([r is not None for r in rules], dtype=bool)
+
+        idx = np.flatnonzero(applicable)
+        self.lat = signs.lat[idx]
+        self.lng = signs.lng[idx]
+        self.props = [signs.props[i] for i in idx]
+        self.rules = [rules[i] for i in idx]
+
+        # One schedule row per distinct sign text
+        schedule_ids = {}
+        rows = []
+        self.schedule_id = np.empty(len(idx), dtype=np.int32)
+        for n, i in enumerate(idx):
+            key = " ".join(str(texts[i]).upper().split())
+            if key not in schedule_ids:
+                schedule_ids[key] = len(rows)
+                rows.append(schedule_buckets(rules[i]))
+            self.schedule_id[n] = schedule_ids[key]
+        self.schedules = np.vstack(rows) if rows else np.zeros((0, BUCKETS_PER_WEEK), dtype=np.uint8)
+
+        # Uniform grid over lat/lng for the nearby lookup
+        self.cell_degrees = cell_degrees
+        self._grid = {}
+        cells_lat = np.floor(self.lat / cell_degrees).astype(np.int64)
+        cells_lng = np.floor(self.lng / cell_degrees).astype(np.int64)
+        order = np.lexsort((cells_lng, cells_lat))
+        keys = list(zip(cells_lat[order], cells_lng[order]))
+        start = 0
+        for end in range(1, len(order) + 1):
+            if end == len(order) or keys[end] != keys[start]:
+                self._grid[keys[start]] = order[start:end]
+                start = end
+
+    def __len__(self):
+        return len(self.lat)
+
+    def nearby(self, lat, lon, radius_meters=30, limit=5):
+        """Indexes and distances of the nearest applicable signs within radius_meters."""
+        span = int(math.ceil(radius_meters / (self.cell_degrees * 111_000))) + 1
+        clat, clng = math.floor(lat / self.cell_degrees), math.floor(lon / self.cell_degrees)
+        found = [
+            self._grid[(clat + i, clng + j)]
+            for i in range(-span, span + 1) for j in range(-span, span + 1)
+            if (clat + i, clng + j) in self._grid
+        ]
+        if not found:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        idx = np.concatenate(found)
+        # Equirectangular distance is plenty at tens of meters
+        dy = (self.lat[idx] - lat) * 111_320
+        dx = (self.lng[idx] - lon) * 111_320 * math.cos(math.radians(lat))
+        dist = np.hypot(dx, dy)
+        keep = dist <= radius_meters
+        idx, dist = idx[keep], dist[keep]
+        order = np.argsort(dist)[:limit]
+        return idx[order], dist[order]
+
+    def check(self, lat, lon, when, radius_meters=30, limit=5):
+        """
+        Evaluate the nearby signs at `when` (a local datetime).
+        Returns {"canPark", "reason", "signs"}.
+        """
+        idx, dist = self.nearby(lat, lon, radius_meters, limit)
+        if len(idx) == 0:
+            return {
+                "canPark": "uncertain",
+                "reason": f"No parking signs found within {radius_meters:g} m, check the street for posted signs.",
+                "signs": [],
+            }
+
+        bucket = time_bucket(when)
+        statuses = self.schedules[self.schedule_id[idx], bucket]
+        signs = [
+            {
+                "text": self.props[i].get("text"),
+                "category": self.props[i].get("category"),
+                "distance_m": round(float(d), 1),
+                "lat": float(self.lat[i]),
+                "lng": float(self.lng[i]),
+                "status": STATUS_NAMES[int(s)],
+            }
+            for i, d, s in zip(idx, dist, statuses)
+        ]
+
+        # The most restrictive sign in effect decides
+        worst = int(statuses.max())
+        sign = signs[int(np.argmax(statuses))]
+        rule = self.rules[idx[int(np.argmax(statuses))]]
+        end = _window_end(rule, when)
+        until = f" until {_format_minutes(end)}" if end is not None else ""
+        if worst == NO_PARKING:
+            return {"canPark": "false", "reason": f"No, parking is not allowed right now{until}: \"{sign['text']}\".", "signs": signs}
+        if worst == UNKNOWN:
+            return {"canPark": "uncertain", "reason": f"A nearby sign has no posted hours: \"{sign['text']}\".", "signs": signs}
+        if worst == TIME_LIMITED:
+            hours = rule["limit_minutes"] / 60
+            limit_text = f"{hours:g} hour" if rule["limit_minutes"] % 60 == 0 else f"{rule['limit_minutes']} minute"
+            return {"canPark": "true", "reason": f"Yes, with a {limit_text} limit{until}: \"{sign['text']}\".", "signs": signs}
+        if worst == PAID:
+            return {"canPark": "true", "reason": f"Yes, paid parking is in effect{until}: \"{sign['text']}\".", "signs": signs}
+        return {"canPark": "true", "reason": "Yes, none of the nearby signs restrict parking right now.", "signs": signs}
+
+
+if __name__ == "__main__":
+    # Quick parser checks: python -m geo.sign_schedules
+    checks = {
+        "NO PARKING 7-9AM MON-FRI": [(7 * 60, 9 * 60)],
+        "2 HR PARKING 8-6PM EXCEPT SUNDAY": [(8 * 60, 18 * 60)],
+        "PAY TO PARK 11-2PM": [(11 * 60, 14 * 60)],
+        "TOW AWAY ZONE 10PM TO 6AM": [(22 * 60, 6 * 60)],
+        "PAY TO PARK 8AM-NOON SAT SUN": [(8 * 60, 12 * 60)],
+        "NO PARKING 7AM-9AM 4PM-6PM MON-FRI": [(7 * 60, 9 * 60), (16 * 60, 18 * 60)],
+    }
+    for text, expected in checks.items():
+        rule = parse_sign_text(text)
+        got = rule["windows"]
+        assert got == expected, f"{text}: got {got}, expected {expected}"
+        print(f"ok  {text}: " + ", ".join(f"{_format_minutes(a)}-{_format_minutes(b)}" for a, b in got))
+
+    day_checks = {
+        "NO PARKING 7AM-9AM 4PM-6PM MON-FRI": {0, 1, 2, 3, 4},
+        "2 HR PARKING 8AM-6PM EXCEPT SUNDAY": {0, 1, 2, 3, 4, 5},
+        "NO PARKING MONTHLY 7AM-9AM": set(range(7)),
+        "PAY TO PARK 8AM-6PM MONDAY THRU SATURDAY": {0, 1, 2, 3, 4, 5},
+    }
+    for text, expected in day_checks.items():
+        got = parse_sign_text(text)["days"]
+        assert got == expected, f"{text}: got days {sorted(got)}, expected {sorted(expected)}"
+        print(f"ok  {text}: days {sorted(got)}")
+
+    # Monday 17:00 falls in the second window of the peak-hour sign
+    from datetime import datetime
+    week = schedule_buckets(parse_sign_text("NO PARKING 7AM-9AM 4PM-6PM MON-FRI"))
+    assert week[time_bucket(datetime(2026, 10, 19, 17, 0))] == NO_PARKING
+    assert week[time_bucket(datetime(2026, 10, 19, 12, 0))] == UNRESTRICTED
+    print("ok  peak-hour sign is no_parking Mon 5PM, unrestricted Mon noon")
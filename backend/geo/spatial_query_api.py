@@ -2,8 +2,11 @@ import geopandas as gpd
 from shapely.geometry import Point
 import matplotlib.pyplot as plt
 import boto3
+import hashlib
 import time
 import os
+import re
+import threading
 from dotenv import load_dotenv
 import os, time
 
@@ -76,116 +79,215 @@ def normalize_feature_coords(feature):
         **feature
     }
 
-def get_signs_nearby(lat, lon, athena_client, log, radius_meters=500, debug=False, top_n=10):
-
-
-    db_name = os.getenv("AWS_DB_SIG")
-    table_name = os.getenv("AWS_TABLE_SIG")
-    output_location = os.getenv("AWS_ATHENA_OUTPUT")
-
-    query = f"""
-    WITH input_point AS (
-        SELECT ST_Point({lon}, {lat}) AS geom
-    )
-    SELECT
-        s.*,
-        ST_Distance(ST_Point(s.shape_lng, s.shape_lat), ip.geom) * 111139 AS distance_m
-    FROM "AwsDataCatalog"."{db_name}"."{table_name}" s
-    CROSS JOIN input_point ip
-    WHERE ST_Distance(ST_Point(s.shape_lng, s.shape_lat), ip.geom) * 111139 <= {radius_meters}
-    ORDER BY distance_m
-    LIMIT {top_n};
-    """
+# Prepared statements, registered once per workgroup by prepare_statements().
+# Table names come from trusted config and are baked in at registration; every
+# per-request value goes through ExecutionParameters. Identical EXECUTE +
+# parameters can be answered from Athena's result reuse cache.
+ATHENA_WORKGROUP = os.getenv("AWS_ATHENA_WORKGROUP", "primary")
+ATHENA_RESULT_REUSE_MINUTES = int(os.getenv("ATHENA_RESULT_REUSE_MINUTES", "60"))
+# Snapping to 4 decimals (~11 m) makes nearby repeat searches identical, so they can reuse results
+ATHENA_SNAP_DECIMALS = int(os.getenv("ATHENA_SNAP_DECIMALS", "4"))
+
+SIGNS_STATEMENT = "caniparkhere_signs_nearby"
+GARAGES_STATEMENT = "caniparkhere_garages_nearby"
+
+# Parameters: lon, lat, radius_m, categories, top_n
+SIGNS_QUERY = """
+WITH input_point AS (
+    SELECT ST_Point(CAST(? AS double), CAST(? AS double)) AS geom
+), params AS (
+    SELECT CAST(? AS double) AS radius_m, CAST(? AS varchar) AS categories
+)
+SELECT
+    s.*,
+    ST_Distance(ST_Point(s.shape_lng, s.shape_lat), ip.geom) * 111139 AS distance_m
+FROM "AwsDataCatalog"."{db_name}"."{table_name}" s
+CROSS JOIN input_point ip
+CROSS JOIN params p
+WHERE ST_Distance(ST_Point(s.shape_lng, s.shape_lat), ip.geom) * 111139 <= p.radius_m
+AND (p.categories = '' OR contains(split(p.categories, ','), s.category))
+ORDER BY distance_m
+LIMIT ?
+"""
+
+# Parameters: lon, lat, radius_m, top_n
+GARAGES_QUERY = """
+WITH user_point AS (
+    SELECT to_spherical_geography(ST_Point(CAST(? AS double), CAST(? AS double))) AS geom
+)
+SELECT
+    pg.*,
+    ST_X(ST_Centroid(ST_GeomFromBinary(pg.geometry))) AS lng,
+    ST_Y(ST_Centroid(ST_GeomFromBinary(pg.geometry))) AS lat,
+    ST_Distance(
+        to_spherical_geography(ST_Centroid(ST_GeomFromBinary(pg.geometry))),
+        up.geom
+    ) AS distance_m
+FROM "AwsDataCatalog"."{db_name}"."{table_name}" pg
+CROSS JOIN user_point up
+WHERE ST_Distance(
+        to_spherical_geography(ST_Centroid(ST_GeomFromBinary(pg.geometry))),
+        up.geom
+    ) <= CAST(? AS double)
+ORDER BY distance_m ASC
+LIMIT ?
+"""
+
+ATHENA_PREPARE_RETRY_SECONDS = float(os.getenv("ATHENA_PREPARE_RETRY_SECONDS", "300"))
+
+_prepared = set()
+_prepared_lock = threading.Lock()
+_prepare_failed_at = None
+
+
+def _statements():
+    """{statement: (registered name, SQL)}. The name carries a hash of the SQL, so deploys running different SQL don't overwrite each other."""
+    queries = {
+        SIGNS_STATEMENT: SIGNS_QUERY.format(db_name=os.getenv("AWS_DB_SIG"), table_name=os.getenv("AWS_TABLE_SIG")),
+        GARAGES_STATEMENT: GARAGES_QUERY.format(db_name=os.getenv("AWS_DB_PUB"), table_name=os.getenv("AWS_TABLE_PUB")),
+    }
+    return {
+        statement: (f"{statement}_{hashlib.sha1(query.encode()).hexdigest()[:12]}", query)
+        for statement, query in queries.items()
+    }
 
-    response = athena_client.start_query_execution(
-        QueryString=query,
-        QueryExecutionContext={"Database": db_name},
-        ResultConfiguration={"OutputLocation": output_location},
-    )
 
-    execution_id = response["QueryExecutionId"]
+def prepare_statements(athena_client, log=None):
+    """Create the prepared statements in the workgroup (a no-op for ones that already exist)."""
+    global _prepare_failed_at
+    with _prepared_lock:
+        try:
+            for statement, (name, query) in _statements().items():
+                try:
+                    athena_client.create_prepared_statement(
+                        StatementName=name, WorkGroup=ATHENA_WORKGROUP, QueryStatement=query,
+                    )
+                except athena_client.exceptions.InvalidRequestException as e:
+                    # Same name means same SQL, so an existing statement is fine as is
+                    if "already exists" not in str(e).lower():
+                        raise
+                _prepared.add(statement)
+        except Exception:
+            _prepare_failed_at = time.monotonic()
+            raise
+        _prepare_failed_at = None
+        if log:
+            log.info(f"Athena prepared statements ready in workgroup {ATHENA_WORKGROUP}: {sorted(_prepared)}")
+
+
+def _use_prepared(athena_client, statement, log) -> bool:
+    """
+    Whether `statement` can be EXECUTEd. If registering failed (e.g. no
+    athena:CreatePreparedStatement permission) queries run the same
+    parameterized SQL inline, and registration is retried at most every
+    ATHENA_PREPARE_RETRY_SECONDS.
+    """
+    if statement in _prepared:
+        return True
+    if _prepare_failed_at is not None and time.monotonic() - _prepare_failed_at < ATHENA_PREPARE_RETRY_SECONDS:
+        return False
+    try:
+        prepare_statements(athena_client, log)
+    except Exception as e:
+        log.error(f"Registering Athena prepared statements failed, running queries inline: {e}")
+        return False
+    return statement in _prepared
 
-    while True:
-        status = athena_client.get_query_execution(QueryExecutionId=execution_id)
-        state = status["QueryExecution"]["Status"]["State"]
-        if state in ("SUCCEEDED", "FAILED", "CANCELLED"):
-            break
-        time.sleep(1)
 
-    if state != "SUCCEEDED":
-        log.error(f"Athena query failed with state {state}")
-        raise RuntimeError(f"Athena query failed with state {state}")
+def _snap(value: float) -> str:
+    return repr(round(float(value), ATHENA_SNAP_DECIMALS))
 
-    result = athena_client.get_query_results(QueryExecutionId=execution_id)
 
-    rows = parse_athena_results(result, numeric_fields=["SHAPE_LAT", "SHAPE_LNG", "distance_m"])
-    normalized = [normalize_feature_coords(r) for r in rows if normalize_feature_coords(r) is not None]
-    log.info(f"Normalized rows length is {len(normalized)}")
-    return normalized
+def _category_param(categories):
+    """Category codes as one comma-joined SQL string literal ('' = no filter)."""
+    for c in categories or ():
+        # Only plain codes like "PPEAK": no commas or quotes inside the literal
+        if not re.fullmatch(r"[A-Za-z0-9_]+", c):
+            raise ValueError(f"Invalid sign category: {c!r}")
+    return "'" + ",".join(sorted(categories or ())) + "'"
 
 
-def public_parking_nearby(lat: float, lon: float, athena_client, log, radius_meters: float = 50, top_n: int = 10, debug=False):
-    """Return public parking lots/garages within radius_meters of given lat/lon using Athena."""
-    _validate_lat_lon(lat, lon)
+class QueryCancelled(Exception):
+    pass
 
-    db_name = os.getenv("AWS_DB_PUB")
-    table_name = os.getenv("AWS_TABLE_PUB")
-    output_location = os.getenv("AWS_ATHENA_OUTPUT")
-
-    query = f"""
-    WITH user_point AS (
-        SELECT to_spherical_geography(ST_Point({lon}, {lat})) AS geom
-    )
-    SELECT
-        pg.*,
-        ST_X(ST_Centroid(ST_GeomFromBinary(pg.geometry))) AS lng,
-        ST_Y(ST_Centroid(ST_GeomFromBinary(pg.geometry))) AS lat,
-        ST_Distance(
-            to_spherical_geography(ST_Centroid(ST_GeomFromBinary(pg.geometry))),
-            up.geom
-        ) AS distance_m
-    FROM "AwsDataCatalog"."{db_name}"."{table_name}" pg
-    CROSS JOIN user_point up
-    WHERE ST_Distance(
-            to_spherical_geography(ST_Centroid(ST_GeomFromBinary(pg.geometry))),
-            up.geom
-        ) <= {radius_meters}
-    ORDER BY distance_m ASC
-    LIMIT {top_n};
-    """
 
-    response = athena_client.start_query_execution(
-        QueryString=query,
-        QueryExecutionContext={"Database": db_name},
-        ResultConfiguration={"OutputLocation": output_location},
-    )
-
-    execution_id = response["QueryExecutionId"]
+def _run_query(athena_client, statement, params, log, poll_initial=0.1, poll_max=1.0, cancel_event=None):
+    """
+    EXECUTE a prepared statement (or its SQL inline, see _use_prepared) with ExecutionParameters and wait for it.
+    Polls with backoff (fast queries and reused results finish in well under a second).
+    Setting cancel_event (a threading.Event) stops the running query and raises QueryCancelled.
+    """
+    cancel_event = cancel_event or threading.Event()
+    name, query = _statements()[statement]
+    query_string = f"EXECUTE {name}" if _use_prepared(athena_client, statement, log) else query
+    if cancel_event.is_set():
+        raise QueryCancelled(statement)
+
+    request = {
+        "QueryString": query_string,
+        "ExecutionParameters": params,
+        "WorkGroup": ATHENA_WORKGROUP,
+        "ResultConfiguration": {"OutputLocation": os.getenv("AWS_ATHENA_OUTPUT")},
+    }
+    if ATHENA_RESULT_REUSE_MINUTES > 0:
+        request["ResultReuseConfiguration"] = {
+            "ResultReuseByAgeConfiguration": {"Enabled": True, "MaxAgeInMinutes": ATHENA_RESULT_REUSE_MINUTES}
+        }
+    execution_id = athena_client.start_query_execution(**request)["QueryExecutionId"]
 
-    # Wait for query completion
+    delay = poll_initial
     while True:
-        status = athena_client.get_query_execution(QueryExecutionId=execution_id)
-        state = status["QueryExecution"]["Status"]["State"]
+        execution = athena_client.get_query_execution(QueryExecutionId=execution_id)["QueryExecution"]
+        state = execution["Status"]["State"]
         if state in ("SUCCEEDED", "FAILED", "CANCELLED"):
             break
-        time.sleep(1)
+        if cancel_event.wait(delay):
+            # Don't keep paying for a query nobody is waiting on
+            athena_client.stop_query_execution(QueryExecutionId=execution_id)
+            log.info(f"Athena {statement} cancelled: {execution_id}")
+            raise QueryCancelled(execution_id)
+        delay = min(delay * 1.5, poll_max)
 
     if state != "SUCCEEDED":
-        log.error(f"Athena query failed with state {state}")
+        reason = execution["Status"].get("StateChangeReason", "")
+        log.error(f"Athena query failed with state {state}: {reason}")
         raise RuntimeError(f"Athena query failed with state {state}")
 
-    # Get results
-    result = athena_client.get_query_results(QueryExecutionId=execution_id)
+    reused = execution.get("Statistics", {}).get("ResultReuseInformation", {}).get("ReusedPreviousResult", False)
+    log.info(f"Athena {statement} finished, reused previous result: {reused}")
+    return athena_client.get_query_results(QueryExecutionId=execution_id)
+
+
+def get_signs_nearby(lat, lon, athena_client, log, radius_meters=500, debug=False, top_n=10, categories=None, cancel_event=None):
+    """
+    Return parking signs within radius_meters of given lat/lon using Athena.
+    If categories is given, only signs with those category codes are returned.
+    """
+    _validate_lat_lon(lat, lon)
+    category_param = _category_param(categories)
+    params = [_snap(lon), _snap(lat), repr(float(radius_meters)), category_param, str(int(top_n))]
+    result = _run_query(athena_client, SIGNS_STATEMENT, params, log, cancel_event=cancel_event)
+
+    rows = parse_athena_results(result, numeric_fields=["shape_lat", "shape_lng", "distance_m"])
+    normalized = [n for n in (normalize_feature_coords(r) for r in rows) if n is not None]
+    if debug:
+        log.info(f"Found {len(normalized)} signs within {radius_meters}m of ({lat}, {lon})")
+    log.info(f"Normalized rows length is {len(normalized)}")
+    return normalized
+
 
-    # print(f"Athena query result: {result}")
+def public_parking_nearby(lat: float, lon: float, athena_client, log, radius_meters: float = 50, top_n: int = 10, debug=False, cancel_event=None):
+    """Return public parking lots/garages within radius_meters of given lat/lon using Athena."""
+    _validate_lat_lon(lat, lon)
+    params = [_snap(lon), _snap(lat), repr(float(radius_meters)), str(int(top_n))]
+    result = _run_query(athena_client, GARAGES_STATEMENT, params, log, cancel_event=cancel_event)
 
     # Specify which fields should be numeric
-    numeric_fields = ["distance_m", "dea_stalls", "vacant", "regionid"]
+    numeric_fields = ["distance_m", "dea_stalls", "vacant", "regionid", "lat", "lng"]
     rows = parse_athena_results(result, numeric_fields=numeric_fields)
 
-    log.info(f"Parsed rows of length={len(rows)}: {rows}")
+    if debug:
+        log.info(f"Parsed rows of length={len(rows)}: {rows}")
     log.info(f"Parsed rows length is {len(rows)}")
 
     return rows
-
-
@@ -0,0 +1,161 @@
+import math
+import os
+import duckdb
+from dotenv import load_dotenv
+
+from geo.spatial_query_api import _validate_lat_lon, normalize_feature_coords
+
+load_dotenv()
+
+# Same Parquet files we upload for Athena, served from the VM's local disk instead.
+# Note: these paths are from main.py's perspective (uvicorn runs from the backend folder).
+SIGNS_PARQUET_PATH = os.getenv("SIGNS_PARQUET_PATH", "./data/SDOT_STREET_SIGNS.parquet")
+GARAGES_PARQUET_PATH = os.getenv("GARAGES_PARQUET_PATH", "./data/public_garages_and_parking_lots.parquet")
+
+# Athena's sign query measures planar distance in degrees and scales it by this factor.
+DEGREES_TO_METERS = 111139
+
+
+def _geometry_expr(con, source: str, column: str = "geometry") -> str:
+    """
+    Return a SQL expression that yields a GEOMETRY for `column`.
+    Newer DuckDB builds read GeoParquet geometry columns as GEOMETRY directly,
+    older ones (and plain Parquet) hand us the raw WKB blob.
+    """
+    column_types = {name: dtype for name, dtype, *_ in con.execute(f"DESCRIBE SELECT * FROM {source}").fetchall()}
+    if column_types.get(column, "").upper() == "GEOMETRY":
+        return column
+    return f"ST_GeomFromWKB({column})"
+
+
+def connect(signs_path: str = SIGNS_PARQUET_PATH, garages_path: str = GARAGES_PARQUET_PATH, materialize: bool = None):
+    """
+    Open an in-process DuckDB connection with the spatial extension loaded
+    and `signs` / `garages` relations registered over the Parquet files.
+
+    By default `signs` is a view straight over the Parquet file so DuckDB can
+    skip row groups using the shape_lat/shape_lng min/max statistics.
+    Set DUCKDB_MATERIALIZE=1 (or materialize=True) to copy it into memory instead.
+    Garages are always materialized with their centroid precomputed, since the
+    dataset is small and ST_Centroid would otherwise run for every row on every query.
+    """
+    if materialize is None:
+        materialize = os.getenv("DUCKDB_MATERIALIZE", "0") == "1"
+
+    con = duckdb.connect(os.getenv("DUCKDB_DATABASE", ":memory:"))
+    con.execute("INSTALL spatial")
+    con.execute("LOAD spatial")
+    threads = os.getenv("DUCKDB_THREADS")
+    if threads:
+        con.execute(f"SET threads = {int(threads)}")
+
+    signs_source = f"read_parquet('{signs_path}')"
+    if materialize:
+        con.execute(f"CREATE OR REPLACE TABLE signs AS SELECT * FROM {signs_source}")
+    else:
+        con.execute(f"CREATE OR REPLACE VIEW signs AS SELECT * FROM {signs_source}")
+
+    garages_source = f"read_parquet('{garages_path}')"
+    garage_geom = _geometry_expr(con, garages_source)
+    con.execute(f"""
+        CREATE OR REPLACE TABLE garages AS
+        SELECT
+            * EXCLUDE (geometry),
+            ST_X(ST_Centroid({garage_geom})) AS lng,
+            ST_Y(ST_Centroid({garage_geom})) AS lat
+        FROM {garages_source}
+    """)
+    return con
+
+
+def _rows_to_dicts(cursor):
+    # Athena hands back lower-cased column names, keep the same contract here
+    cols = [d[0].lower() for d in cursor.description]
+    return [dict(zip(cols, row)) for row in cursor.fetchall()]
+
+
+def get_signs_nearby(lat, lon, con, log, radius_meters=500, debug=False, top_n=10, categories=None):
+    """
+    Return parking signs within radius_meters of given lat/lon using DuckDB.
+    Same distance semantics as the Athena query (planar degrees * 111139).
+    If categories is given, only signs with those category codes are returned.
+    """
+    _validate_lat_lon(lat, lon)
+
+    # Bounding box in degrees around the point. Filtering on the raw columns
+    # lets DuckDB prune row groups before any distance is computed.
+    delta = radius_meters / DEGREES_TO_METERS
+
+    query = f"""
+    SELECT
+        s.*,
+        ST_Distance(ST_Point(s.shape_lng, s.shape_lat), ST_Point($lon, $lat)) * {DEGREES_TO_METERS} AS distance_m
+    FROM signs s
+    WHERE s.shape_lat BETWEEN $lat - $delta AND $lat + $delta
+      AND s.shape_lng BETWEEN $lon - $delta AND $lon + $delta
+      AND ST_Distance(ST_Point(s.shape_lng, s.shape_lat), ST_Point($lon, $lat)) * {DEGREES_TO_METERS} <= $radius
+      {"AND list_contains($categories, s.category)" if categories else ""}
+    ORDER BY distance_m
+    LIMIT $top_n
+    """
+
+    # One cursor per call: DuckDB connections are not safe to share across threads
+    cur = con.cursor()
+    try:
+        params = {"lat": lat, "lon": lon, "delta": delta, "radius": radius_meters, "top_n": top_n}
+        if categories:
+            params["categories"] = list(categories)
+        cur.execute(query, params)
+        rows = _rows_to_dicts(cur)
+    finally:
+        cur.close()
+
+    normalized = [n for n in (normalize_feature_coords(r) for r in rows) if n is not None]
+    if debug:
+        log.info(f"Found {len(normalized)} signs within {radius_meters}m of ({lat}, {lon})")
+    log.info(f"Normalized rows length is {len(normalized)}")
+    return normalized
+
+
+def public_parking_nearby(lat: float, lon: float, con, log, radius_meters: float = 50, top_n: int = 10, debug=False):
+    """
+    Return public parking lots/garages within radius_meters of given lat/lon using DuckDB.
+    Distance is measured on the sphere from the garage centroid, like the Athena query.
+    """
+    _validate_lat_lon(lat, lon)
+
+    # Generous bounding box so the haversine check only runs on nearby garages
+    lat_delta = radius_meters / 111320
+    lon_delta = radius_meters / (111320 * max(math.cos(math.radians(lat)), 0.01))
+
+    # ST_Distance_Sphere expects [latitude, longitude] axis order
+    query = """
+    SELECT *
+    FROM (
+        SELECT
+            g.*,
+            ST_Distance_Sphere(ST_Point(g.lat, g.lng), ST_Point($lat, $lon)) AS distance_m
+        FROM garages g
+        WHERE g.lat BETWEEN $lat - $lat_delta AND $lat + $lat_delta
+          AND g.lng BETWEEN $lon - $lon_delta AND $lon + $lon_delta
+    )
+    WHERE distance_m <= $radius
+    ORDER BY distance_m ASC
+    LIMIT $top_n
+    """
+
+    cur = con.cursor()
+    try:
+        cur.execute(query, {
+            "lat": lat, "lon": lon,
+            "lat_delta": lat_delta, "lon_delta": lon_delta,
+            "radius": radius_meters, "top_n": top_n,
+        })
+        rows = _rows_to_dicts(cur)
+    finally:
+        cur.close()
+
+    if debug:
+        log.info(f"Found {len(rows)} public parking facilities within {radius_meters}m.")
+    log.info(f"Parsed rows length is {len(rows)}")
+    return rows
@@ -1,28 +1,30 @@
-import geopandas as gpd
-from shapely.geometry import Point
-import matplotlib.pyplot as plt
+import itertools
+import os
+import threading
+import time
 
-# Load datasets at startup
-# Note: these file paths are from the main.py's perspective, so the uvicorn command is run from the root of the backend folder. thus, dont' do ../
+import geopandas as gpd
+import pandas as pd
+import shapely
+from shapely.geometry import Point, box
+from pyproj import Transformer
+
+# Datasets to load. Note: these file paths are from the main.py's perspective, so the uvicorn
+# command is run from the root of the backend folder. thus, dont' do ../
+DATASET_PATHS = {
+    "signs": os.getenv("LOCAL_SIGNS_PATH", "./data/sdot_street_signs_3857.geojson"),
+    "garages": os.getenv("LOCAL_GARAGES_PATH", "./data/public_garages_and_parking_lots_20250807.geojson"),
+    "street_parking": os.getenv("LOCAL_STREET_PARKING_PATH", "./data/street_parking_20250807.geojson"),
+}
 # rpz_data = gpd.read_file("data/rpz_areas_4326.geojson").to_crs(epsg=4326)
-public_parking_data = gpd.read_file(
-    "./data/public_garages_and_parking_lots_20250807.geojson"
-).to_crs(epsg=4326)
 
-sdot_street_signs_data = gpd.read_file(
-    "./data/sdot_street_signs_3857.geojson"
-).to_crs(epsg=4326)
+# Column identifying the same feature across SDOT exports. Features without one
+# are identified by their content hash, so an edit shows up as remove + add.
+FEATURE_ID_COLUMN = os.getenv("LOCAL_FEATURE_ID_COLUMN", "objectid")
 
-street_parking_data = gpd.read_file(
-    "./data/street_parking_20250807.geojson"
-).to_crs(epsg=4326)
+_to_3857 = Transformer.from_crs("EPSG:4326", "EPSG:3857", always_xy=True)
+_versions = itertools.count(1)
 
-# Pre-project to EPSG:3857 for distance calculations
-sdot_street_signs_data_3857 = gpd.read_file("./data/sdot_street_signs_3857.geojson")
-print(f"SDOT street signs CRS: {sdot_street_signs_data_3857.crs}")
-street_parking_data_3857 = street_parking_data.to_crs(epsg=3857)
-public_parking_data_3857 = public_parking_data.to_crs(epsg=3857)
-# rpz_data_3857 = rpz_data.to_crs(epsg=3857)
 
 def _validate_lat_lon(lat: float, lon: float):
     """Ensure lat/lon are in valid ranges and not swapped."""
@@ -39,73 +41,234 @@ def _validate_lat_lon(lat: float, lon: float):
         )
 
 
-def get_signs_nearby(lat: float, lon: float, radius_meters: float = 500, debug=False, top_n = 10):
-    """Return parking signs within radius_meters of given lat/lon."""
-    _validate_lat_lon(lat, lon)
-
-    pt = gpd.GeoSeries([Point(lon, lat)], crs="EPSG:4326").to_crs(epsg=3857)
-
-    # ax = sdot_street_signs_data_3857.plot(figsize=(8, 8), color="blue", markersize=5)
-    # pt.plot(ax=ax, color="red", markersize=50)
-    # plt.show()
-
-    print("Signs CRS:", sdot_street_signs_data_3857.crs)
-    print("Point CRS:", pt.crs)
-    distances = sdot_street_signs_data_3857.distance(pt.iloc[0])
-    min_idx = distances.idxmin()
-    print(f"Closest sign is {distances[min_idx]:.2f} m away")
-    nearby = sdot_street_signs_data_3857[distances <= radius_meters].copy()
+def read_dataset(path: str) -> gpd.GeoDataFrame:
+    """
+    Read a GeoJSON/Parquet file into EPSG:3857 (for meter distances) with lower-cased
+    columns (like Athena returns) and the _fid / _hash bookkeeping columns used for diffs.
+    """
+    gdf = gpd.read_parquet(path) if path.endswith(".parquet") else gpd.read_file(path)
+    gdf = gdf.to_crs(epsg=3857)
+
+    # Drop duplicate columns (case-insensitive), first one wins
+    seen = set()
+    keep = []
+    for c in gdf.columns:
+        if c.lower() not in seen:
+            seen.add(c.lower())
+            keep.append(c)
+    gdf = gdf[keep]
+    gdf.columns = [c if c == gdf.geometry.name else c.lower() for c in gdf.columns]
+
+    props = pd.DataFrame(gdf.drop(columns=gdf.geometry.name)).astype(str)
+    props["_wkb"] = shapely.to_wkb(gdf.geometry.values)
+    gdf["_hash"] = pd.util.hash_pandas_object(props, index=False).values
+    if FEATURE_ID_COLUMN in gdf.columns:
+        fid = gdf[FEATURE_ID_COLUMN].astype(str)
+    else:
+        fid = gdf["_hash"].astype(str)
+    # diff_dataset indexes by _fid, so it has to be unique. Exports occasionally repeat an
+    # OBJECTID (and identical rows repeat a hash); number the repeats in file order.
+    repeat = fid.groupby(fid).cumcount()
+    gdf["_fid"] = fid.where(repeat == 0, fid + "#" + repeat.astype(str))
+    return gdf.reset_index(drop=True)
+
+
+class Snapshot:
+    """
+    One immutable version of every loaded dataset, with spatial indexes built.
+    Queries grab a snapshot once and use it throughout, so a swap never
+    changes the data under an in-flight query.
+    """
+
+    def __init__(self, datasets: dict, version: int = None):
+        self.version = version or next(_versions)
+        self.datasets = datasets
+        self.loaded_at = time.time()
+        for gdf in datasets.values():
+            gdf.sindex  # geopandas builds this lazily; build it now, off the query path
+
+        # Per-category sub-indexes, so a category-filtered search only walks relevant signs
+        self.sign_categories = {}
+        signs = datasets.get("signs")
+        if signs is not None and "category" in signs.columns:
+            for category, subset in signs.groupby("category"):
+                subset = subset.reset_index(drop=True)
+                subset.sindex
+                self.sign_categories[category] = subset
+
+    def replace(self, name: str, gdf: gpd.GeoDataFrame) -> "Snapshot":
+        return Snapshot({**self.datasets, name: gdf})
+
+
+def diff_dataset(old: gpd.GeoDataFrame, new: gpd.GeoDataFrame):
+    """
+    Compare two versions of a dataset by feature ID.
+    Returns (merged GeoDataFrame, stats). Unchanged rows are reused from `old`.
+    """
+    old_hash = pd.Series(old["_hash"].values, index=old["_fid"])
+    new_hash = pd.Series(new["_hash"].values, index=new["_fid"])
+
+    added = new_hash.index.difference(old_hash.index)
+    removed = old_hash.index.difference(new_hash.index)
+    common = old_hash.index.intersection(new_hash.index)
+    changed = common[old_hash[common].values != new_hash[common].values]
+
+    drop = removed.union(changed)
+    take = added.union(changed)
+    merged = pd.concat(
+        [old[~old["_fid"].isin(drop)], new[new["_fid"].isin(take)]],
+        ignore_index=True,
+    )
+    merged = gpd.GeoDataFrame(merged, geometry=old.geometry.name, crs=old.crs)
+    stats = {"added": len(added), "removed": len(removed), "changed": len(changed), "total": len(merged)}
+    return merged, stats
+
+
+class SnapshotStore:
+    """
+    Holds the current Snapshot and swaps in new ones atomically.
+    Listeners registered with on_swap (e.g. the search cache) run after each swap.
+    """
+
+    def __init__(self, snapshot: Snapshot = None):
+        self._snapshot = snapshot
+        self._swap_lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._listeners = []
+        self.last_refresh = None  # outcome of the most recent refresh, shown in /health
+
+    def current(self) -> Snapshot:
+        return self._snapshot
+
+    @property
+    def version(self):
+        return self._snapshot.version if self._snapshot else None
+
+    def on_swap(self, fn):
+        self._listeners.append(fn)
+
+    def swap(self, snapshot: Snapshot):
+        with self._swap_lock:
+            old = self._snapshot
+            self._snapshot = snapshot  # single reference assignment, readers see old or new
+        for fn in self._listeners:
+            fn(old, snapshot)
+
+    def refresh(self, name: str, path: str = None, log=None):
+        """
+        Diff `path` against the current version of dataset `name`, build the
+        merged dataset and its index, then swap it in. Blocking; one at a time.
+        """
+        path = path or DATASET_PATHS[name]
+        with self._refresh_lock:
+            try:
+                stats = self._refresh(name, path, log)
+            except Exception as e:
+                self.last_refresh = {"dataset": name, "status": "error", "error": str(e), "at": time.time()}
+                raise
+            self.last_refresh = {**stats, "status": "ok", "at": time.time()}
+            return stats
+
+    def _refresh(self, name: str, path: str, log=None):
+        start = time.perf_counter()
+        current = self.current()
+        new = read_dataset(path)
+        if current is not None and name in current.datasets:
+            merged, stats = diff_dataset(current.datasets[name], new)
+            if not (stats["added"] or stats["removed"] or stats["changed"]):
+                # The export was just confirmed current, so the snapshot is fresh again
+                current.loaded_at = time.time()
+                if log:
+                    log.info(f"Dataset {name} unchanged, keeping version {current.version}")
+                return {"dataset": name, "version": current.version, **stats}
+            snapshot = current.replace(name, merged)
+        else:
+            stats = {"added": len(new), "removed": 0, "changed": 0, "total": len(new)}
+            snapshot = Snapshot({**(current.datasets if current else {}), name: new})
+        self.swap(snapshot)
+        stats = {"dataset": name, "version": snapshot.version, "seconds": round(time.perf_counter() - start, 2), **stats}
+        if log:
+            log.info(f"Swapped in dataset refresh: {stats}")
+        return stats
+
+    def refresh_in_background(self, name: str, path: str = None, log=None) -> threading.Thread:
+        def run():
+            try:
+                self.refresh(name, path, log=log)
+            except Exception as e:
+                if log:
+                    log.error(f"Dataset refresh for {name} failed, keeping current version: {e}")
+
+        thread = threading.Thread(target=run, name=f"refresh-{name}", daemon=True)
+        thread.start()
+        return thread
+
+
+def load_store(paths: dict = None) -> SnapshotStore:
+    """Load every dataset (skipping missing files) into a fresh SnapshotStore."""
+    paths = paths or DATASET_PATHS
+    datasets = {name: read_dataset(path) for name, path in paths.items() if os.path.exists(path)}
+    return SnapshotStore(Snapshot(datasets))
+
+
+def _nearby(gdf: gpd.GeoDataFrame, lat: float, lon: float, radius_meters: float, top_n: int):
+    """Rows of gdf within radius_meters of lat/lon, nearest first, as EPSG:4326 dicts."""
+    x, y = _to_3857.transform(lon, lat)
+    pt = Point(x, y)
+
+    # Spatial index narrows to the bounding box, exact distance does the rest
+    idx = gdf.sindex.query(box(x - radius_meters, y - radius_meters, x + radius_meters, y + radius_meters))
+    candidates = gdf.iloc[idx]
+    distances = candidates.distance(pt)
+    nearby = candidates[distances <= radius_meters].copy()
     nearby["distance_m"] = distances[distances <= radius_meters]
+    nearby = nearby.sort_values("distance_m").head(top_n)
 
-    nearby = nearby.sort_values("distance_m")
+    # Centroid in the projected CRS, then back to lat/lng
+    centroids = nearby.geometry.centroid.to_crs(epsg=4326)
+    nearby["lat"] = centroids.y
+    nearby["lng"] = centroids.x
+    records = pd.DataFrame(nearby.drop(columns=[nearby.geometry.name, "_fid", "_hash"]))
+    return records.to_dict("records")
 
+
+def get_signs_nearby(lat: float, lon: float, store: SnapshotStore, log, radius_meters: float = 500, debug=False, top_n=10, categories=None):
+    """
+    Return parking signs within radius_meters of given lat/lon.
+    If categories is given, only those category codes are searched, using their sub-indexes.
+    """
+    _validate_lat_lon(lat, lon)
+    snapshot = store.current()
+    if categories is None:
+        nearby = _nearby(snapshot.datasets["signs"], lat, lon, radius_meters, top_n)
+    else:
+        nearby = []
+        for category in categories:
+            subset = snapshot.sign_categories.get(category)
+            if subset is not None:
+                nearby += _nearby(subset, lat, lon, radius_meters, top_n)
+        nearby = sorted(nearby, key=lambda r: r["distance_m"])[:top_n]
     if debug:
-        print(f"Found {len(nearby)} signs within {radius_meters}m of ({lat}, {lon})")
-    
-    # print(f"Nearby signs: {nearby.head(top_n)}")
-    return nearby.to_crs(epsg=4326).to_dict("records")
+        log.info(f"Found {len(nearby)} signs within {radius_meters}m of ({lat}, {lon}) in version {snapshot.version}")
+    return nearby
 
 
-def get_parking_street(lat: float, lon: float, radius_meters: float = 20, debug=False, top_n: int = 10):
+def get_parking_street(lat: float, lon: float, store: SnapshotStore, log, radius_meters: float = 20, debug=False, top_n: int = 10):
     """Return street parking segments within radius_meters of given lat/lon."""
     _validate_lat_lon(lat, lon)
-
-    pt = gpd.GeoSeries([Point(lon, lat)], crs="EPSG:4326").to_crs(epsg=3857)
-
-    distances = street_parking_data_3857.distance(pt.iloc[0])
-    nearby = street_parking_data_3857[distances <= radius_meters]
-
+    nearby = _nearby(store.current().datasets["street_parking"], lat, lon, radius_meters, top_n)
     if debug:
-        print(f"Found {len(nearby)} street parking segments nearby.")
+        log.info(f"Found {len(nearby)} street parking segments nearby.")
+    return nearby
 
-    return nearby.to_crs(epsg=4326).to_dict("records")
 
-
-def public_parking_nearby(lat: float, lon: float, radius_meters: float = 50, debug=False, top_n: int = 10):
+def public_parking_nearby(lat: float, lon: float, store: SnapshotStore, log, radius_meters: float = 50, top_n: int = 10, debug=False):
     """Return public parking lots/garages within radius_meters of given lat/lon."""
     _validate_lat_lon(lat, lon)
-
-    # Create point in EPSG:4326 and project to EPSG:3857 for meter-based distance
-    pt = gpd.GeoSeries([Point(lon, lat)], crs="EPSG:4326").to_crs(epsg=3857)
-
-    # Calculate distances in meters
-    distances = public_parking_data_3857.distance(pt.iloc[0])
-
-    # Filter by radius
-    nearby = public_parking_data_3857[distances <= radius_meters].copy()
-
-    # Add distance column
-    nearby["distance_m"] = distances[distances <= radius_meters]
-
-    # Sort by distance
-    nearby = nearby.sort_values("distance_m")
-
+    nearby = _nearby(store.current().datasets["garages"], lat, lon, radius_meters, top_n)
     if debug:
-        print(f"Found {len(nearby)} public parking facilities within {radius_meters}m.")
-        print(nearby[["distance_m"]].head())
-
-    # Return as list of dicts in EPSG:4326 with distance included
-    return nearby.to_crs(epsg=4326).to_dict("records")
+        log.info(f"Found {len(nearby)} public parking facilities within {radius_meters}m.")
+    return nearby
 
 
 # def get_rpz_zone(lat: float, lon: float):
@@ -123,4 +286,4 @@ def public_parking_nearby(lat: float, lon: float, radius_meters: float = 50, deb
 #     _validate_lat_lon(lat, lon)
 #     pt = gpd.GeoSeries([Point(lon, lat)], crs="EPSG:4326")
 #     matching = categories_data[categories_data.contains(pt.iloc[0])]
-#     return matching.to_dict("records")
\ No newline at end of file
+#     return matching.to_dict("records")
@@ -0,0 +1,83 @@
+import os
+from psycopg import sql
+from psycopg_pool import AsyncConnectionPool
+from dotenv import load_dotenv
+
+from geo.spatial_query_api import _validate_lat_lon
+
+load_dotenv()
+
+# Tables are created by geo/geojson_to_postgis.py
+POSTGIS_DSN = os.getenv("POSTGIS_DSN")
+SIGNS_TABLE = os.getenv("POSTGIS_TABLE_SIG", "sdot_signs")
+GARAGES_TABLE = os.getenv("POSTGIS_TABLE_PUB", "public_garages")
+
+# ST_DWithin filters through the GiST index, <-> walks the same index in
+# distance order so the LIMIT stops the scan early.
+NEARBY_QUERY = """
+WITH input_point AS (
+    SELECT ST_SetSRID(ST_MakePoint(%(lon)s, %(lat)s), 4326)::geography AS geog
+)
+SELECT
+    t.props,
+    ST_Y(t.geog::geometry) AS lat,
+    ST_X(t.geog::geometry) AS lng,
+    ST_Distance(t.geog, ip.geog) AS distance_m
+FROM {table} t
+CROSS JOIN input_point ip
+WHERE ST_DWithin(t.geog, ip.geog, %(radius)s)
+{filters}
+ORDER BY t.geog <-> ip.geog
+LIMIT %(top_n)s
+"""
+
+
+def create_pool(dsn: str = POSTGIS_DSN, min_size: int = None, max_size: int = None) -> AsyncConnectionPool:
+    """
+    Create the pooled async connection used by the query functions below.
+    The pool is created closed; call `await pool.open()` once the event loop is running.
+    """
+    if not dsn:
+        raise ValueError("POSTGIS_DSN is not set")
+    return AsyncConnectionPool(
+        dsn,
+        min_size=min_size or int(os.getenv("POSTGIS_POOL_MIN", "1")),
+        max_size=max_size or int(os.getenv("POSTGIS_POOL_MAX", "10")),
+        kwargs={"autocommit": True},
+        open=False,
+    )
+
+
+async def _nearby(pool, table, lat, lon, radius_meters, top_n, categories=None):
+    # category is its own indexed column on the signs table, see geojson_to_postgis.py
+    filters = sql.SQL("AND t.category = ANY(%(categories)s)") if categories else sql.SQL("")
+    query = sql.SQL(NEARBY_QUERY).format(table=sql.Identifier(table), filters=filters)
+    params = {"lat": lat, "lon": lon, "radius": radius_meters, "top_n": top_n, "categories": list(categories or [])}
+    async with pool.connection() as conn:
+        cur = await conn.execute(query, params)
+        rows = await cur.fetchall()
+    # props is the original feature (lower-cased columns, like Athena returns)
+    return [{"lat": lat_, "lng": lng_, **props, "distance_m": dist} for props, lat_, lng_, dist in rows]
+
+
+async def get_signs_nearby(lat, lon, pool, log, radius_meters=500, debug=False, top_n=10, categories=None):
+    """
+    Return parking signs within radius_meters of given lat/lon using PostGIS.
+    If categories is given, only signs with those category codes are returned.
+    """
+    _validate_lat_lon(lat, lon)
+    rows = await _nearby(pool, SIGNS_TABLE, lat, lon, radius_meters, top_n, categories=categories)
+    if debug:
+        log.info(f"Found {len(rows)} signs within {radius_meters}m of ({lat}, {lon})")
+    log.info(f"Normalized rows length is {len(rows)}")
+    return rows
+
+
+async def public_parking_nearby(lat: float, lon: float, pool, log, radius_meters: float = 50, top_n: int = 10, debug=False):
+    """Return public parking lots/garages within radius_meters of given lat/lon using PostGIS."""
+    _validate_lat_lon(lat, lon)
+    rows = await _nearby(pool, GARAGES_TABLE, lat, lon, radius_meters, top_n)
+    if debug:
+        log.info(f"Found {len(rows)} public parking facilities within {radius_meters}m.")
+    log.info(f"Parsed rows length is {len(rows)}")
+    return rows
@@ -1,13 +1,17 @@
-from spatial_query_local import get_signs_nearby, get_parking_street, public_parking_nearby
-import geopandas as gpd
+import structlog
+
+from spatial_query_local import load_store, get_signs_nearby, get_parking_street, public_parking_nearby
 
 if __name__ == "__main__":
+    # Run from the backend folder so the ./data paths resolve
+    log = structlog.get_logger()
+    store = load_store()
     # expects lat, lon format
     lat, lon = 47.669275640565886, -122.3115761265412
-    signs_nearby = get_signs_nearby(lat=lat, lon=lon, radius_meters=200)
-    # your_street_parking = get_parking_street(lat=lat, lon=lon, radius_meters=30)
-    # parking_nearby = public_parking_nearby(lat=lat, lon=lon, radius_meters=500)
+    signs_nearby = get_signs_nearby(lat, lon, store, log, radius_meters=200, top_n=20)
+    # your_street_parking = get_parking_street(lat, lon, store, log, radius_meters=30)
+    # parking_nearby = public_parking_nearby(lat, lon, store, log, radius_meters=500)
     
     print(f"Here is a small list of parking signs near you: {signs_nearby[:20]}")
     # print(f"Here is a small list of street parking segments near you: {your_street_parking[:2]}")
-    # print(f"Here is a small list of public parking facilities near you: {parking_nearby[:20]}")
\ No newline at end of file
+    # print(f"Here is a small list of public parking facilities near you: {parking_nearby[:20]}")
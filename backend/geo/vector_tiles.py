@@ -0,0 +1,201 @@
+"""
+Pre-generated Mapbox Vector Tiles for signs and garages, stored as MBTiles.
+
+Tiles are built once at ingest time and stored in the deduplicated MBTiles
+layout (map + images tables), where images.tile_id is the MD5 of the gzipped
+tile. That id doubles as the strong ETag the API serves, so a tile that did not
+change between builds keeps its ETag and stays cached in browsers and the CDN.
+
+Layers:
+    clusters - below point_zoom, grid clusters from geo.clustering (count, signs, garages)
+    signs    - category, text
+    garages  - address
+
+Build (from the backend folder):
+    python -m geo.vector_tiles out.mbtiles --min-zoom 10 --max-zoom 16 --point-zoom 14
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+
+import mapbox_vector_tile
+import numpy as np
+
+from geo import point_data
+from geo.clustering import ClusterPyramid, mercator_xy
+
+EXTENT = 4096
+
+MBTILES_SCHEMA = """
+CREATE TABLE metadata (name TEXT, value TEXT);
+CREATE TABLE map (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_id TEXT);
+CREATE TABLE images (tile_data BLOB, tile_id TEXT);
+CREATE UNIQUE INDEX map_index ON map (zoom_level, tile_column, tile_row);
+CREATE UNIQUE INDEX images_id ON images (tile_id);
+CREATE VIEW tiles AS
+    SELECT map.zoom_level, map.tile_column, map.tile_row, images.tile_data
+    FROM map JOIN images ON images.tile_id = map.tile_id;
+"""
+
+
+def _clean(props):
+    # MVT attributes can't be null
+    return {k: v for k, v in props.items() if v is not None}
+
+
+def _add_features(tiles, zoom, layer, lat, lng, props):
+    """Bucket features into tiles[(x, y)][layer] with tile-local pixel coordinates."""
+    if len(lat) == 0:
+        return
+    n = 1 << zoom
+    x, y = mercator_xy(lat, lng)
+    px, py = x * n, y * n
+    tx = np.clip(np.floor(px).astype(np.int64), 0, n - 1)
+    ty = np.clip(np.floor(py).astype(np.int64), 0, n - 1)
+    lx = np.round((px - tx) * EXTENT).astype(np.int64)
+    ly = np.round((py - ty) * EXTENT).astype(np.int64)
+    for i in range(len(lat)):
+        tiles[(int(tx[i]), int(ty[i]))][layer].append({
+            "geometry": f"POINT({lx[i]} {ly[i]})",
+            "properties": _clean(props[i]),
+        })
+
+
+def build_mbtiles(output_path, signs, garages, min_zoom=10, max_zoom=16, point_zoom=14):
+    """Render every non-empty tile for zooms min_zoom..max_zoom into an MBTiles file."""
+    start = time.perf_counter()
+    pyramid = ClusterPyramid([signs, garages], min_zoom=min_zoom, max_zoom=max_zoom)
+    layer_for_kind = {"sign": "signs", "garage": "garages"}
+
+    tmp_path = f"{output_path}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    db = sqlite3.connect(tmp_path)
+    db.executescript(MBTILES_SCHEMA)
+
+    n_tiles = 0
+    for zoom in range(min_zoom, max_zoom + 1):
+        tiles = defaultdict(lambda: defaultdict(list))
+        if zoom >= point_zoom:
+            for points in (signs, garages):
+                _add_features(tiles, zoom, layer_for_kind[points.kind], points.lat, points.lng, points.props)
+        else:
+            level = pyramid.levels[zoom]
+            multi = np.flatnonzero(level.count > 1)
+            cluster_props = [
+                {"count": int(level.count[i]), **{f"{k}s": int(level.kind_counts[k][i]) for k in pyramid.kind_names}}
+                for i in multi
+            ]
+            _add_features(tiles, zoom, "clusters", level.lat[multi], level.lng[multi], cluster_props)
+            for i in level.first_index[level.count == 1]:
+                kind = pyramid.kinds[i]
+                _add_features(tiles, zoom, layer_for_kind[kind], pyramid.lat[i:i + 1], pyramid.lng[i:i + 1], [pyramid.props[i]])
+
+        for (tx, ty), layers in tiles.items():
+            mvt = mapbox_vector_tile.encode(
+                [{"name": name, "features": features} for name, features in layers.items()],
+                default_options={"extents": EXTENT, "y_coord_down": True},
+            )
+            data = gzip.compress(mvt, mtime=0)  # mtime=0 keeps identical tiles byte-identical across builds
+            tile_id = hashlib.md5(data).hexdigest()
+            db.execute("INSERT OR IGNORE INTO images (tile_data, tile_id) VALUES (?, ?)", (data, tile_id))
+            # MBTiles rows are TMS (y flipped)
+            db.execute(
+                "INSERT INTO map (zoom_level, tile_column, tile_row, tile_id) VALUES (?, ?, ?, ?)",
+                (zoom, tx, (1 << zoom) - 1 - ty, tile_id),
+            )
+        n_tiles += len(tiles)
+        print(f"  zoom {zoom}: {len(tiles)} tiles")
+
+    all_lat = np.concatenate([signs.lat, garages.lat])
+    all_lng = np.concatenate([signs.lng, garages.lng])
+    metadata = {
+        "name": "caniparkhere",
+        "format": "pbf",
+        "compression": "gzip",
+        "minzoom": str(min_zoom),
+        "maxzoom": str(max_zoom),
+        "bounds": f"{all_lng.min()},{all_lat.min()},{all_lng.max()},{all_lat.max()}",
+        "generated_at": str(int(time.time())),
+        "json": json.dumps({"vector_layers": [
+            {"id": "clusters", "fields": {"count": "Number", "signs": "Number", "garages": "Number"}},
+            {"id": "signs", "fields": {"category": "String", "text": "String"}},
+            {"id": "garages", "fields": {"address": "String"}},
+        ]}),
+    }
+    db.executemany("INSERT INTO metadata (name, value) VALUES (?, ?)", metadata.items())
+    db.commit()
+    db.execute("VACUUM")
+    db.close()
+    os.replace(tmp_path, output_path)
+
+    print(f"Wrote {n_tiles} tiles to {output_path} in {time.perf_counter() - start:.1f}s")
+    return n_tiles
+
+
+class TileArchive:
+    """
+    Read-only access to an MBTiles file. SQLite maps the whole file into memory
+    (PRAGMA mmap_size), so a tile lookup is an index probe plus a memcpy.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._mmap_size = os.path.getsize(path)
+        self._local = threading.local()
+        self.metadata = dict(self._conn().execute("SELECT name, value FROM metadata").fetchall())
+        self.min_zoom = int(self.metadata.get("minzoom", 0))
+        self.max_zoom = int(self.metadata.get("maxzoom", 22))
+        # Content-Encoding for the stored tiles; archives without the key are sniffed
+        self.encoding = self.metadata.get("compression") or self._sniff_encoding()
+        if self.encoding not in ("gzip", "none"):
+            raise ValueError(f"Unsupported tile compression in {path}: {self.encoding}")
+
+    def _conn(self):
+        # sqlite3 connections are per thread; requests run on the event loop and the threadpool
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro&immutable=1", uri=True, check_same_thread=False)
+            conn.execute(f"PRAGMA mmap_size = {self._mmap_size}")
+            self._local.conn = conn
+        return conn
+
+    def _sniff_encoding(self):
+        row = self._conn().execute("SELECT tile_data FROM images LIMIT 1").fetchone()
+        return "gzip" if row and bytes(row[0][:2]) == b"\x1f\x8b" else "none"
+
+    def get(self, z: int, x: int, y: int):
+        """(tile bytes as stored, see self.encoding; tile_id) for XYZ tile coordinates, or None if the tile is empty."""
+        row = self._conn().execute(
+            "SELECT images.tile_data, images.tile_id FROM map JOIN images ON images.tile_id = map.tile_id "
+            "WHERE map.zoom_level = ? AND map.tile_column = ? AND map.tile_row = ?",
+            (z, x, (1 << z) - 1 - y),
+        ).fetchone()
+        return row
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-generate vector tiles for signs and garages")
+    parser.add_argument("output", help="MBTiles file to write")
+    parser.add_argument("--signs", default=point_data.SIGNS_PARQUET_PATH, help="signs Parquet file")
+    parser.add_argument("--garages", default=point_data.GARAGES_PARQUET_PATH, help="garages Parquet file")
+    parser.add_argument("--categories", nargs="*", default=None, help="only include these sign category codes")
+    parser.add_argument("--min-zoom", type=int, default=10)
+    parser.add_argument("--max-zoom", type=int, default=16)
+    parser.add_argument("--point-zoom", type=int, default=14, help="first zoom with individual points instead of clusters")
+    args = parser.parse_args()
+
+    build_mbtiles(
+        args.output,
+        point_data.load_sign_points(args.signs, categories=args.categories),
+        point_data.load_garage_points(args.garages),
+        min_zoom=args.min_zoom,
+        max_zoom=args.max_zoom,
+        point_zoom=args.point_zoom,
+    )
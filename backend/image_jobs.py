@@ -0,0 +1,164 @@
+"""
+Background job queue for /check-parking-image in async mode.
+
+Uploads are put on a bounded asyncio.Queue and processed by a fixed number of
+worker tasks, so a burst of uploads turns into queued jobs instead of
+connections held open for the whole vision call. When the queue is full,
+submit() raises QueueFull and the API answers 429. Finished jobs are kept for
+result_ttl_seconds so clients can poll (or long-poll) GET /jobs/{id}.
+"""
+
+import asyncio
+import time
+import uuid
+from collections import OrderedDict, deque
+
+from fastapi import HTTPException
+
+
+class QueueFull(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__(f"Job queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class Job:
+    def __init__(self, payload):
+        self.id = str(uuid.uuid4())
+        self.payload = payload
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.error_status = None
+        self.created_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+        self.done = asyncio.Event()
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "result": self.result,
+            "error": self.error,
+            "error_status": self.error_status,
+        }
+
+
+def _percentile_ms(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(1000 * values[int(q * (len(values) - 1))], 2)
+
+
+class JobQueue:
+    def __init__(self, handler, max_queue: int = 100, workers: int = 4, result_ttl_seconds: float = 600):
+        """handler: async function payload -> result, run by the workers."""
+        self.handler = handler
+        self.max_queue = max_queue
+        self.workers = workers
+        self.result_ttl_seconds = result_ttl_seconds
+        self._queue = None
+        self._tasks = []
+        self._jobs = OrderedDict()
+        self._busy = 0
+        self._wait_times = deque(maxlen=512)
+        self._run_times = deque(maxlen=512)
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def start(self):
+        """Start the workers; needs the running event loop."""
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._tasks = [asyncio.create_task(self._worker(), name=f"image-job-worker-{i}") for i in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    @property
+    def running(self):
+        return bool(self._tasks)
+
+    def submit(self, payload) -> Job:
+        self._prune()
+        job = Job(payload)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise QueueFull(self._retry_after())
+        self._jobs[job.id] = job
+        self.submitted += 1
+        return job
+
+    def get(self, job_id: str):
+        return self._jobs.get(job_id)
+
+    async def wait(self, job: Job, timeout: float):
+        """Long-poll: return once the job finishes or timeout seconds pass."""
+        if timeout > 0 and not job.done.is_set():
+            try:
+                await asyncio.wait_for(job.done.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return job
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            job.status = "running"
+            job.started_at = time.monotonic()
+            self._wait_times.append(job.started_at - job.created_at)
+            self._busy += 1
+            try:
+                job.result = await self.handler(job.payload)
+                job.status = "done"
+                self.completed += 1
+            except Exception as e:
+                job.status = "error"
+                job.error = e.detail if isinstance(e, HTTPException) else str(e)
+                job.error_status = e.status_code if isinstance(e, HTTPException) else 500
+                self.failed += 1
+            finally:
+                self._busy -= 1
+                job.payload = None  # drop the image bytes
+                job.finished_at = time.monotonic()
+                self._run_times.append(job.finished_at - job.started_at)
+                job.done.set()
+                self._queue.task_done()
+
+    def _retry_after(self):
+        # Roughly how long until the queue drains, from recent job durations
+        run_times = list(self._run_times)
+        avg = sum(run_times) / len(run_times) if run_times else 5.0
+        return max(1, int(avg * self._queue.qsize() / max(1, self.workers)))
+
+    def _prune(self):
+        now = time.monotonic()
+        while self._jobs:
+            job = next(iter(self._jobs.values()))
+            if job.finished_at is None or now - job.finished_at < self.result_ttl_seconds:
+                break
+            self._jobs.popitem(last=False)
+
+    def stats(self):
+        return {
+            "running": self.running,
+            "workers": self.workers,
+            "busy": self._busy,
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "max_queue": self.max_queue,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "wait_ms_avg": round(1000 * sum(self._wait_times) / len(self._wait_times), 2) if self._wait_times else None,
+            "wait_ms_p95": _percentile_ms(self._wait_times, 0.95),
+            "run_ms_p95": _percentile_ms(self._run_times, 0.95),
+        }
@@ -0,0 +1,83 @@
+"""
+Token budgets and usage accounting for the OpenAI calls.
+
+Every call records its prompt, cached and completion token counts, and each
+route has a budget: max_tokens for the completion and a character cap for the
+session summary that is sent back on follow-ups.
+
+OpenAI only caches prompt prefixes of 1024 tokens or more. The system prompts
+here are a few hundred tokens, so cached_tokens is expected to stay at 0; the
+per-route cached counts (and cache_hit_calls) are reported as seen, so /health
+shows it if that changes.
+"""
+
+import json
+import os
+import threading
+
+
+class TokenBudget:
+    def __init__(self, route: str, max_tokens: int, summary_chars: int = 0):
+        # e.g. LLM_IMAGE_MAX_TOKENS, LLM_FOLLOWUP_SUMMARY_CHARS
+        prefix = f"LLM_{route.upper()}"
+        self.route = route
+        self.max_tokens = int(os.getenv(f"{prefix}_MAX_TOKENS", str(max_tokens)))
+        self.summary_chars = int(os.getenv(f"{prefix}_SUMMARY_CHARS", str(summary_chars)))
+
+
+# Least useful fields first; rules is what answers follow-up questions
+SUMMARY_TRIM_ORDER = ("advice", "parsedText", "reason")
+
+
+def compact_summary(summary: dict, max_chars: int = 0) -> str:
+    """Summary as compact JSON, trimmed to max_chars (0 = no limit)."""
+    dump = lambda d: json.dumps(d, separators=(",", ":"), ensure_ascii=False)
+    text = dump(summary)
+    if not max_chars or len(text) <= max_chars:
+        return text
+
+    summary = dict(summary)
+    for key in SUMMARY_TRIM_ORDER:
+        summary.pop(key, None)
+        text = dump(summary)
+        if len(text) <= max_chars:
+            return text
+    rules = str(summary.get("rules", ""))
+    overflow = len(text) - max_chars
+    summary["rules"] = rules[:max(0, len(rules) - overflow - 3)] + "..."
+    return dump(summary)
+
+
+class UsageTracker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    def record(self, route: str, response) -> dict:
+        """Add a chat completion's token usage to the route totals and return this call's counts."""
+        usage = getattr(response, "usage", None)
+        details = getattr(usage, "prompt_tokens_details", None)
+        call = {
+            "prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+            "cached_tokens": getattr(details, "cached_tokens", 0) or 0,
+            "completion_tokens": getattr(usage, "completion_tokens", 0) or 0,
+        }
+        with self._lock:
+            totals = self._routes.setdefault(route, {
+                "calls": 0, "cache_hit_calls": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0,
+            })
+            totals["calls"] += 1
+            totals["cache_hit_calls"] += call["cached_tokens"] > 0
+            for k, v in call.items():
+                totals[k] += v
+        return call
+
+    def stats(self):
+        with self._lock:
+            return {
+                route: {
+                    **totals,
+                    "cached_ratio": round(totals["cached_tokens"] / totals["prompt_tokens"], 3) if totals["prompt_tokens"] else 0.0,
+                }
+                for route, totals in self._routes.items()
+            }
@@ -1,9 +1,19 @@
-from geo.spatial_query_api import get_signs_nearby, public_parking_nearby
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Body, Request
+from geo import spatial_query_api, point_data
+from geo.clustering import ClusterPyramid
+from geo.sign_schedules import LocationEngine
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Body, Request, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse
 from datetime import datetime
+from zoneinfo import ZoneInfo
+import asyncio
 import base64
+import hmac
+import inspect
 import os
+import random
+import time
 from openai import OpenAI
 import json
 import uuid
@@ -12,17 +22,30 @@ import requests
 import firebase_admin
 from firebase_admin import credentials
 import boto3
+from botocore.config import Config
 from botocore.exceptions import ClientError
 import structlog 
 import uvicorn
 
+from search_cache import SearchCache
+from search_sessions import SearchSessions, feature_id
+from firebase_tokens import FirebaseTokenCache
+from image_jobs import JobQueue, QueueFull
+from llm_usage import TokenBudget, UsageTracker, compact_summary
+from profiling import Profiler, activate_sampler, deactivate_sampler, profiled
+from query_coordinator import DeadlineExceeded, HedgedQuery
 from message_types import (
     ParkingCheckResponse,
     ParkingSearchResponse,
     LocationCheckResponse,
+    LocationCheckRequest,
     ParkingSearchRequest,
     FollowUpRequest, 
-    FollowUpResponse
+    FollowUpResponse,
+    DatasetRefreshRequest,
+    ViewportResponse,
+    JobAcceptedResponse,
+    JobStatusResponse,
 )
 from dotenv import load_dotenv
 load_dotenv()
@@ -58,6 +81,24 @@ parking_signs = {
 # Reverse mapping for quick lookup
 code_to_desc = {code: desc for desc, codes in parking_signs.items() for code in codes}
 
+
+def resolve_sign_categories(requested):
+    """
+    Turn the categories of a ParkingSearchRequest (codes or descriptions) into a
+    sorted tuple of codes. None means every known category.
+    """
+    if not requested:
+        return tuple(sorted(code_to_desc))
+    codes = set()
+    for item in requested:
+        if item in code_to_desc:
+            codes.add(item)
+        elif item in parking_signs:
+            codes.update(parking_signs[item])
+        else:
+            raise HTTPException(status_code=400, detail=f"Unknown sign category: {item}")
+    return tuple(sorted(codes))
+
 store = {}
 
 try:
@@ -71,8 +112,26 @@ try:
 except Exception as e:
     log.error(f"Warning: Firebase initialization failed: {e}")
 
+
+def create_firebase_token(clerk_user_id: str) -> str:
+    from firebase_admin import auth
+    return auth.create_custom_token(clerk_user_id).decode()
+
+
+# Minted tokens are reused per Clerk user for most of their 1h lifetime
+firebase_tokens = FirebaseTokenCache(
+    create_firebase_token,
+    max_entries=int(os.getenv("FIREBASE_TOKEN_CACHE_MAX_ENTRIES", "10000")),
+    ttl_seconds=float(os.getenv("FIREBASE_TOKEN_CACHE_TTL_SECONDS", "3000")),
+    max_concurrency=int(os.getenv("FIREBASE_SIGNING_CONCURRENCY", "4")),
+)
+
 # Initialize OpenAI client (conditional for API generation)
 client = None
+# Per-route completion/summary budgets (LLM_<ROUTE>_MAX_TOKENS, LLM_<ROUTE>_SUMMARY_CHARS) and token counts
+image_budget = TokenBudget("image", max_tokens=300)
+followup_budget = TokenBudget("followup", max_tokens=280, summary_chars=1200)
+llm_usage = UsageTracker()
 try:
     if os.getenv("OPENAI_API_KEY"):
         client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
@@ -90,26 +149,207 @@ try:
     aws_region = os.getenv("AWS_REGION", "us-west-2")
     
     if aws_access_key_id and aws_secret_access_key:
-        s3_client = boto3.client(
-            's3',
+        # One session and one pooled, retrying client config shared by every AWS client
+        aws_session = boto3.session.Session(
             aws_access_key_id=aws_access_key_id,
             aws_secret_access_key=aws_secret_access_key,
-            region_name=aws_region
+            region_name=aws_region,
+        )
+        aws_client_config = Config(
+            max_pool_connections=int(os.getenv("AWS_MAX_POOL_CONNECTIONS", "20")),
+            retries={"mode": "adaptive", "max_attempts": int(os.getenv("AWS_MAX_ATTEMPTS", "5"))},
+            connect_timeout=5,
+            read_timeout=30,
         )
+        s3_client = aws_session.client('s3', config=aws_client_config)
         log.info("s3 client initialized successfully")
 
-        athena_client = boto3.client(
-            'athena',
-            aws_access_key_id=aws_access_key_id,
-            aws_secret_access_key=aws_secret_access_key,
-            region_name=aws_region
-        )
+        athena_client = aws_session.client('athena', config=aws_client_config)
         log.info("athena client initialized successfully")
     else:
         log.error("Warning: AWS credentials not found")
 except Exception as e:
     log.error(f"Warning: S3/Athena client initialization failed: {e}")
 
+# Pick the spatial query backend. Every backend module exposes the same
+# get_signs_nearby / public_parking_nearby contract; only the client differs.
+#   athena - Athena over the Parquet files in S3 (default)
+#   duckdb - in-process DuckDB over local Parquet files, see geo/spatial_query_duckdb.py
+#   postgis - GiST-indexed PostGIS tables loaded by geo/geojson_to_postgis.py
+#   local - in-memory GeoDataFrames, hot-swappable via /admin/refresh-dataset, see geo/spatial_query_local.py
+SPATIAL_BACKEND = os.getenv("SPATIAL_BACKEND", "athena").lower()
+spatial_query = spatial_query_api
+spatial_client = athena_client
+try:
+    if SPATIAL_BACKEND == "duckdb":
+        from geo import spatial_query_duckdb
+        spatial_query = spatial_query_duckdb
+        spatial_client = spatial_query_duckdb.connect()
+        log.info("DuckDB spatial backend initialized successfully")
+    elif SPATIAL_BACKEND == "postgis":
+        from geo import spatial_query_postgis
+        spatial_query = spatial_query_postgis
+        # opened in the startup hook, the pool needs a running event loop
+        spatial_client = spatial_query_postgis.create_pool()
+        log.info("PostGIS spatial backend configured")
+    elif SPATIAL_BACKEND == "local":
+        from geo import spatial_query_local
+        spatial_query = spatial_query_local
+        spatial_client = spatial_query_local.load_store()
+        log.info(f"Local spatial backend loaded, dataset version {spatial_client.version}")
+except Exception as e:
+    log.error(f"Warning: {SPATIAL_BACKEND} spatial backend initialization failed, falling back to athena: {e}")
+    SPATIAL_BACKEND = "athena"
+    spatial_query = spatial_query_api
+    spatial_client = athena_client
+
+# Searches run on SPATIAL_BACKEND first and are hedged to Athena when it is slow, empty, failing or stale.
+# SEARCH_HEDGE_BACKEND="" turns hedging off; the deadline applies either way.
+SEARCH_HEDGE_BACKEND = os.getenv("SEARCH_HEDGE_BACKEND", "athena").lower()
+LOCAL_MAX_STALENESS_SECONDS = float(os.getenv("LOCAL_MAX_STALENESS_SECONDS", "0"))
+hedged_query = HedgedQuery(
+    deadline=float(os.getenv("SEARCH_DEADLINE_MS", "10000")) / 1000,
+    hedge_delay=float(os.getenv("SEARCH_HEDGE_DELAY_MS", "500")) / 1000,
+)
+
+# Cached /search-parking results, keyed by dataset version
+search_cache = SearchCache(
+    max_entries=int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "2048")),
+    ttl_seconds=float(os.getenv("SEARCH_CACHE_TTL_SECONDS", "300")),
+)
+if SPATIAL_BACKEND == "local":
+    spatial_client.on_swap(search_cache.clear)
+
+# Result ID sets per search_token, for incremental /search-parking
+search_sessions = SearchSessions(
+    max_entries=int(os.getenv("SEARCH_SESSION_MAX_ENTRIES", "10000")),
+    ttl_seconds=float(os.getenv("SEARCH_SESSION_TTL_SECONDS", "900")),
+    min_move_meters=float(os.getenv("SEARCH_SESSION_MIN_MOVE_METERS", "25")),
+)
+
+# Zoom-level cluster hierarchy for /viewport, built at startup and after every dataset swap
+cluster_pyramid = None
+
+
+def build_cluster_pyramid(snapshot=None):
+    global cluster_pyramid
+    signs, garages = point_data.load_points(snapshot, categories=code_to_desc.keys())
+    if signs is None:
+        log.info("No sign/garage point data found, /viewport disabled")
+        return
+    pyramid = ClusterPyramid([signs, garages], max_zoom=int(os.getenv("CLUSTER_MAX_ZOOM", "16")))
+    cluster_pyramid = pyramid
+    log.info(f"Cluster pyramid built: {len(signs)} signs, {len(garages)} garages, zooms {pyramid.min_zoom}-{pyramid.max_zoom}")
+
+
+if SPATIAL_BACKEND == "local":
+    spatial_client.on_swap(lambda old, new: build_cluster_pyramid(new))
+
+# Parsed sign schedules + grid index for /check-location, rebuilt with the pyramid
+LOCAL_TIMEZONE = ZoneInfo(os.getenv("LOCAL_TIMEZONE", "America/Los_Angeles"))
+LOCATION_CHECK_RADIUS = float(os.getenv("LOCATION_CHECK_RADIUS_METERS", "30"))
+location_engine = None
+
+
+def build_location_engine(snapshot=None):
+    global location_engine
+    # Every sign, not just code_to_desc: no-parking and load zone signs matter here
+    signs, _ = point_data.load_points(snapshot)
+    if signs is None:
+        log.info("No sign point data found, /check-location disabled")
+        return
+    engine = LocationEngine(signs)
+    location_engine = engine
+    log.info(f"Location engine built: {len(engine)} of {len(signs)} signs parsed into {len(engine.schedules)} schedules")
+
+
+if SPATIAL_BACKEND == "local":
+    spatial_client.on_swap(lambda old, new: build_location_engine(new))
+
+# Pre-generated vector tiles (see geo/vector_tiles.py), served straight from the archive
+TILES_MBTILES_PATH = os.getenv("TILES_MBTILES_PATH", "./data/parking_tiles.mbtiles")
+TILE_CACHE_MAX_AGE = int(os.getenv("TILE_CACHE_MAX_AGE", "86400"))
+tile_archive = None
+try:
+    if os.path.exists(TILES_MBTILES_PATH):
+        from geo.vector_tiles import TileArchive
+        tile_archive = TileArchive(TILES_MBTILES_PATH)
+        log.info(f"Vector tile archive loaded: {TILES_MBTILES_PATH}")
+except Exception as e:
+    log.error(f"Warning: vector tile archive failed to load: {e}")
+
+
+def dataset_version():
+    """Version of the data behind the spatial backend; only the local backend changes it at runtime."""
+    if SPATIAL_BACKEND == "local":
+        return f"local:{spatial_client.version}"
+    return SPATIAL_BACKEND
+
+
+def is_admin_request(request: Request) -> bool:
+    admin_token = os.getenv("ADMIN_TOKEN")
+    return bool(admin_token) and hmac.compare_digest(request.headers.get("X-Admin-Token", ""), admin_token)
+
+
+def require_admin(request: Request):
+    """Admin endpoints need X-Admin-Token to match ADMIN_TOKEN; they are disabled when it is unset."""
+    if not os.getenv("ADMIN_TOKEN"):
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled")
+    if not is_admin_request(request):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+@app.on_event("startup")
+async def open_spatial_backend():
+    if SPATIAL_BACKEND == "postgis":
+        await spatial_client.open()
+        log.info("PostGIS connection pool opened")
+
+
+@app.on_event("startup")
+async def prepare_athena_statements():
+    if SPATIAL_BACKEND == "athena" and athena_client:
+        try:
+            await run_in_threadpool(spatial_query_api.prepare_statements, athena_client, log)
+        except Exception as e:
+            # Queries run the same SQL inline until registration succeeds (retried every ATHENA_PREPARE_RETRY_SECONDS)
+            log.error(f"Warning: registering Athena prepared statements failed: {e}")
+
+
+@app.on_event("startup")
+async def load_cluster_pyramid():
+    try:
+        snapshot = spatial_client.current() if SPATIAL_BACKEND == "local" else None
+        await run_in_threadpool(build_cluster_pyramid, snapshot)
+    except Exception as e:
+        log.error(f"Warning: cluster pyramid build failed, /viewport disabled: {e}")
+
+
+@app.on_event("startup")
+async def load_location_engine():
+    try:
+        snapshot = spatial_client.current() if SPATIAL_BACKEND == "local" else None
+        await run_in_threadpool(build_location_engine, snapshot)
+    except Exception as e:
+        log.error(f"Warning: location engine build failed, /check-location disabled: {e}")
+
+
+@app.on_event("shutdown")
+async def close_spatial_backend():
+    if SPATIAL_BACKEND == "postgis":
+        await spatial_client.close()
+
+
+@app.on_event("shutdown")
+async def stop_firebase_signing():
+    firebase_tokens.shutdown()
+
+
+async def run_spatial_query(fn, *args, **kwargs):
+    """Await async backends directly; run blocking ones in the threadpool so they don't stall the event loop."""
+    if inspect.iscoroutinefunction(fn):
+        return await fn(*args, **kwargs)
+    return await run_in_threadpool(profiled(fn), *args, **kwargs)
+
 ##### SANITY CHECK CONFIRM YOUR CREDENTIALS ARE WORKING ###### 
 # try:
 #     sts = boto3.client(
@@ -145,38 +385,74 @@ async def log_requests(request: Request, call_next):
     log.info(f"Response status: {response.status_code}")
     return response
 
+# Opt-in sampling profiler: admins send "X-Profile: 1", or PROFILE_SAMPLE_RATE picks requests at random
+PROFILE_PATHS = set(filter(None, os.getenv("PROFILE_PATHS", "/search-parking,/check-parking-image,/check-location").split(",")))
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+profiler = Profiler(
+    max_profiles=int(os.getenv("PROFILE_MAX_PROFILES", "20")),
+    interval=float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000,
+)
+
+
+@app.middleware("http")
+async def profile_requests(request: Request, call_next):
+    if request.url.path not in PROFILE_PATHS:
+        return await call_next(request)
+    if request.headers.get("X-Profile") == "1" and is_admin_request(request):
+        trigger = "header"
+    elif PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+        trigger = "sampled"
+    else:
+        return await call_next(request)
+
+    sampler = profiler.try_start()
+    if sampler is None:
+        return await call_next(request)
+    status = 500
+    token = activate_sampler(sampler)
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        deactivate_sampler(token)
+        # finish joins the sampler thread; do that off the loop
+        profile_id = await asyncio.to_thread(profiler.finish, sampler, request.method, request.url.path, status, trigger)
+    response.headers["X-Profile-Id"] = profile_id
+    return response
+
+
+# System prompts are static; the per-request parts (time, session summary, question)
+# go in the user message. They are too short for OpenAI's prompt caching (1024+ token
+# prefixes), so don't expect cached_tokens in llm_usage unless they grow.
 image_prompt = """
 You are a helpful assistant that interprets parking signs from images.
 Given a photo of a parking sign, output the result in **valid JSON only** with the following keys:
 
-{{
+{
   "isParkingSignFound": "true" | "false",
   "canPark": "true" | "false" | "uncertain",
   "reason": "Clear one-sentence explanation",
   "rules": "Full text of the parsed parking rule(s)",
   "parsedText": "The raw text you extracted from the sign",
   "advice": "Optional human-friendly tip or clarification"
-}}
+}
 
-The current date/time is in '%a %I:%M%p' format: {datetime_str}
+The current date/time is given after the image in '%a %I:%M%p' format.
 Start your sentences with yes or no.
 Use the the current date/time to determine if parking is allowed and reference it in your response.
 Respond with *JSON only*, no extra text. If there is no parking sign found, say parkingSignFound = false in the JSON.
 You must respond with valid JSON only — do NOT use markdown, backticks, or explanations.
 """
 
-followup_prompt_template = """
-    You are a parking assistant.
-
-    Here is the previously parsed parking sign data:
-    {previous_summary}
-
-    Use the current time for your response in '%a %I:%M%p' format: {datetime_str}
-
-    User's follow-up question:
-    \"{question}\"
+followup_prompt = """
+You are a parking assistant.
+The user will give you previously parsed parking sign data (JSON), the current time in '%a %I:%M%p' format, and a follow-up question.
+Answer based only on the parking sign data and general logic. If a sign says 'Pay to Park 8am-8pm', typically that means people can park for free outside of those hours. Be nice.
+"""
 
-    Answer based only on the parking sign data and general logic. If a sign says 'Pay to Park 8am-8pm', typically that means people can park for free outside of those hours. Be nice.
+followup_user_template = """Parking sign data: {previous_summary}
+Current time: {datetime_str}
+Follow-up question: \"{question}\"
 """
 
 # Message types are now imported from message_types.py
@@ -201,11 +477,10 @@ async def get_firebase_token(request: Request):
     except Exception:
         raise HTTPException(status_code=401, detail="Invalid Authorization header format")
 
-    # Create Firebase custom token for this Clerk user ID
-    from firebase_admin import auth
+    # Create (or reuse) a Firebase custom token for this Clerk user ID
     try:
-        firebase_token = auth.create_custom_token(clerk_user_id)
-        return {"customToken": firebase_token.decode()}
+        firebase_token = await firebase_tokens.get(clerk_user_id)
+        return {"customToken": firebase_token}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to create Firebase token: {str(e)}")
 
@@ -232,21 +507,15 @@ async def get_summary_from_image_with_gpt4o(image_bytes: bytes) -> str:
         log.info(f"Datetime: {datetime_str}")
         
         log.info("Making OpenAI API call...")
-        # log.info(f"About to format image_prompt with datetime: {datetime_str}")
         
-        try:
-            formatted_prompt = image_prompt.format(datetime_str=datetime_str)
-            log.info("Prompt formatting successful")
-        except Exception as format_error:
-            log.error(f"Prompt formatting failed: {format_error}")
-            raise
-        
-        response = client.chat.completions.create(
+        # Blocking HTTP call; run it in a thread so the event loop keeps serving
+        response = await asyncio.to_thread(
+            profiled(client.chat.completions.create),
             model="gpt-4o-mini",
             messages = [
                 {
                     "role": "system",
-                    "content": formatted_prompt
+                    "content": image_prompt
                 },
                 {
                     "role": "user",
@@ -256,12 +525,18 @@ async def get_summary_from_image_with_gpt4o(image_bytes: bytes) -> str:
                             "image_url": {
                                 "url": f"data:image/jpeg;base64,{base64_image}"
                             }
+                        },
+                        {
+                            "type": "text",
+                            "text": f"Current date/time: {datetime_str}"
                         }
                     ]
                 }
             ],
-            max_tokens=300
+            max_tokens=image_budget.max_tokens
         )
+        usage = llm_usage.record("image", response)
+        log.info(f"Token usage for image check: {usage}")
         log.info("OpenAI API call successful!")
         log.info(f"Response object type: {type(response)}")
         log.info(f"Response choices length: {len(response.choices)}")
@@ -290,20 +565,13 @@ def extract_json_from_gpt_output(response: str) -> dict:
     except json.JSONDecodeError as e:
         raise HTTPException(status_code=500, detail=f"JSON decode error: {str(e)} | Raw: {json_str[:300]}")
     
-@app.post("/check-parking-image", response_model=ParkingCheckResponse)
-async def check_parking_from_image(
-    file: UploadFile = File(...),
-    datetime_str: str = Form(...),
-) -> ParkingCheckResponse:
+async def analyze_parking_image(image_bytes: bytes) -> ParkingCheckResponse:
     """
     Query ChatGPT, get a JSON response, and return a structured ParkingCheckResponse about the parking image.
-    FastAPI automatically converts the returned object into JSON.
     This also saves the JSON into an in-memory dictionary.
+    Shared by the synchronous route and the background job workers.
     """
-    if not file.content_type or not file.content_type.startswith('image/'):
-        raise HTTPException(status_code=400, detail="File must be an image")
     try:
-        image_bytes = await file.read()
         summary_str = await get_summary_from_image_with_gpt4o(image_bytes)
         summary_json = extract_json_from_gpt_output(summary_str)
         session_id = str(uuid.uuid4())
@@ -331,12 +599,80 @@ async def check_parking_from_image(
         log.error(f"Error processing image: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error processing image: {str(e)}")
 
+
+async def run_image_job(image_bytes: bytes) -> dict:
+    return (await analyze_parking_image(image_bytes)).model_dump()
+
+
+# Async mode for /check-parking-image: bounded queue + fixed worker pool
+image_jobs = JobQueue(
+    run_image_job,
+    max_queue=int(os.getenv("IMAGE_JOB_MAX_QUEUE", "100")),
+    workers=int(os.getenv("IMAGE_JOB_WORKERS", "4")),
+    result_ttl_seconds=float(os.getenv("IMAGE_JOB_RESULT_TTL_SECONDS", "600")),
+)
+
+
+@app.on_event("startup")
+async def start_image_jobs():
+    image_jobs.start()
+
+
+@app.on_event("shutdown")
+async def stop_image_jobs():
+    await image_jobs.stop()
+
+
+@app.post(
+    "/check-parking-image",
+    response_model=ParkingCheckResponse,
+    responses={202: {"model": JobAcceptedResponse}, 429: {"description": "Job queue full, see Retry-After"}},
+)
+async def check_parking_from_image(
+    file: UploadFile = File(...),
+    datetime_str: str = Form(...),
+    async_mode: bool = Form(False),
+):
+    """
+    Analyze a parking sign photo and return a ParkingCheckResponse.
+    With async_mode=true the upload is queued instead and a 202 with a job_id is
+    returned right away; fetch the result from GET /jobs/{job_id}.
+    """
+    if not file.content_type or not file.content_type.startswith('image/'):
+        raise HTTPException(status_code=400, detail="File must be an image")
+    image_bytes = await file.read()
+
+    if not async_mode:
+        return await analyze_parking_image(image_bytes)
+
+    try:
+        job = image_jobs.submit(image_bytes)
+    except QueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    accepted = JobAcceptedResponse(job_id=job.id, status=job.status, status_url=f"/jobs/{job.id}")
+    return JSONResponse(status_code=202, content=accepted.model_dump())
+
+
+@app.get("/jobs/{job_id}", response_model=JobStatusResponse)
+async def get_job(job_id: str, wait: float = Query(0, ge=0, le=30, description="Seconds to long-poll for the result")):
+    """
+    Status of a queued image check; the ParkingCheckResponse is in `result` once status is done.
+    A failed job is still a successful poll: status is "error" and error_status holds the HTTP status
+    the synchronous check would have failed with.
+    """
+    job = image_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    job = await image_jobs.wait(job, wait)
+    return JobStatusResponse(**job.to_dict())
+
 def format_public_parking_point(feature):
     """
     This is just for the public parking facility dataset.
     """
     lng, lat = feature.get("lng"), feature.get("lat")
     return {
+        "id": feature_id("garage", lat, lng, feature.get("objectid"), feature.get("dea_facility_address")),
         "lat": float(lat),
         "lng": float(lng),
         "address": feature.get("dea_facility_address"),
@@ -356,6 +692,7 @@ def format_parking_sign_point(feature):
         lng, lat = -1, -1
     
     return {
+        "id": feature_id("sign", lat, lng, feature.get("objectid"), category, text),
         "lat": lat, 
         "lng": lng,
         "text": text,
@@ -366,38 +703,173 @@ def format_parking_sign_point(feature):
 
 
 
+async def search_backend(module, client, lat, lon, categories, cancel_event=None):
+    """Signs + garages from one spatial backend, formatted for the map."""
+    # Only Athena can stop work mid-query; the other backends finish quickly or are async-cancellable
+    extra = {"cancel_event": cancel_event} if module is spatial_query_api else {}
+    signs_nearby, parking_nearby = await asyncio.gather(
+        run_spatial_query(module.get_signs_nearby, lat, lon, client, log=log, radius_meters=5000, debug=False, top_n=20, categories=categories, **extra),
+        run_spatial_query(module.public_parking_nearby, lat, lon, client, log=log, radius_meters=4000, debug=False, top_n=30, **extra),
+    )
+    # format signs for the map
+    return [format_parking_sign_point(f) for f in signs_nearby], [format_public_parking_point(f) for f in parking_nearby]
+
+
+def search_plan(lat, lon, categories):
+    """(primary, hedge, hedge_reason) for HedgedQuery.run."""
+    primary = (SPATIAL_BACKEND, lambda ev: search_backend(spatial_query, spatial_client, lat, lon, categories, ev))
+    if SEARCH_HEDGE_BACKEND != "athena" or SPATIAL_BACKEND == "athena" or not athena_client:
+        return primary, None, None
+    hedge = ("athena", lambda ev: search_backend(spatial_query_api, athena_client, lat, lon, categories, ev))
+    hedge_reason = None
+    if SPATIAL_BACKEND == "local" and LOCAL_MAX_STALENESS_SECONDS > 0:
+        if time.time() - spatial_client.current().loaded_at > LOCAL_MAX_STALENESS_SECONDS:
+            hedge_reason = "stale"
+    return primary, hedge, hedge_reason
+
+
 @app.post("/search-parking", response_model=ParkingSearchResponse)
 async def check_parking_location(data: ParkingSearchRequest) -> ParkingSearchResponse:
     # Here, your logic to check parking rules by lat/lng + datetime
     # For prototype, return a dummy response:
     lat, lon = data.latitude, data.longitude
+    categories = resolve_sign_categories(data.categories)
     log.info(f"Checking parking at lat: {lat}, lon: {lon}")
 
     try:
-        signs_nearby = get_signs_nearby(lat=lat, lon=lon, athena_client=athena_client, log=log, radius_meters=5000, debug=False, top_n=20)
-        parking_nearby = public_parking_nearby(lat=lat, lon=lon, athena_client=athena_client, log=log, radius_meters=4000, debug=False, top_n=30)
-
-        # format signs for the map
-        signs_list = [format_parking_sign_point(f) for f in signs_nearby]
-        parking_list = [format_public_parking_point(f) for f in parking_nearby]
-        
-        # log.info(f"Raw parking nearby: {parking_nearby[:3]}")
-        log.info(f"Parking nearby: {parking_list[:3]}")
+        version = dataset_version()
+        prev = search_sessions.previous(data.previous_search_token, version, categories)
+        if prev is not None and not search_sessions.moved_enough(prev, lat, lon):
+            # Barely moved: nothing to query, nothing changed
+            return ParkingSearchResponse(
+                session_id=str(uuid.uuid4()),
+                parking_sign_results=[],
+                public_parking_results=[],
+                processing_method="search_api",
+                search_token=data.previous_search_token,
+                is_incremental=True,
+            )
+
+        cache_key = search_cache.key(version, lat, lon, categories)
+        cached = search_cache.get(cache_key)
+        if cached is not None:
+            signs_list, parking_list = cached
+            answered_by = "cache"
+            log.info(f"Search cache hit for {cache_key}")
+        else:
+            (signs_list, parking_list), answered_by = await hedged_query.run(*search_plan(lat, lon, categories))
+            log.info(f"Search answered by {answered_by}")
+
+            # log.info(f"Raw parking nearby: {parking_nearby[:3]}")
+            log.info(f"Parking nearby: {parking_list[:3]}")
+
+            search_cache.put(cache_key, (signs_list, parking_list))
 
-        signs_list = [s for s in signs_list if code_to_desc.get(s['category'])]
         log.info(f"Found {len(parking_list)} public parking lots/garages nearby")
         log.info(f"Filtered to {len(signs_list)} signs with known categories")
 
+        search_token = search_sessions.save(version, categories, lat, lon, signs_list, parking_list)
+        if prev is not None:
+            added_signs, kept_distances, removed_signs, added_parking, removed_parking = search_sessions.diff(prev, signs_list, parking_list)
+            log.info(f"Incremental search: +{len(added_signs)}/-{len(removed_signs)} signs, +{len(added_parking)}/-{len(removed_parking)} garages")
+            return ParkingSearchResponse(
+                session_id=str(uuid.uuid4()),
+                parking_sign_results=added_signs,
+                public_parking_results=added_parking,
+                processing_method="search_api",
+                answered_by=answered_by,
+                search_token=search_token,
+                is_incremental=True,
+                removed_sign_ids=removed_signs,
+                sign_distances=kept_distances,
+                removed_public_parking_ids=removed_parking,
+            )
+
         return ParkingSearchResponse(
             session_id=str(uuid.uuid4()),
             parking_sign_results=signs_list,
             public_parking_results=parking_list,
-            processing_method="search_api"
+            processing_method="search_api",
+            answered_by=answered_by,
+            search_token=search_token,
         )
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error checking location: {str(e)}")
 
 
+@app.post("/check-location", response_model=LocationCheckResponse)
+async def check_location(data: LocationCheckRequest) -> LocationCheckResponse:
+    """
+    Can I park here now? Evaluates the schedules of the nearest signs at the
+    request time (default: now, Seattle time) without calling the LLM.
+    """
+    if location_engine is None:
+        raise HTTPException(status_code=503, detail="Location check not available")
+    try:
+        spatial_query_api._validate_lat_lon(data.latitude, data.longitude)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    when = data.time or datetime.now(LOCAL_TIMEZONE)
+    when = when.replace(tzinfo=LOCAL_TIMEZONE) if when.tzinfo is None else when.astimezone(LOCAL_TIMEZONE)
+
+    result = location_engine.check(data.latitude, data.longitude, when, radius_meters=LOCATION_CHECK_RADIUS)
+    return LocationCheckResponse(**result, checked_at=when.isoformat())
+
+
+@app.get("/viewport", response_model=ViewportResponse)
+async def viewport(
+    min_lat: float = Query(..., ge=-90, le=90),
+    min_lng: float = Query(..., ge=-180, le=180),
+    max_lat: float = Query(..., ge=-90, le=90),
+    max_lng: float = Query(..., ge=-180, le=180),
+    zoom: int = Query(..., ge=0, le=22),
+) -> ViewportResponse:
+    """
+    Every sign and garage in the map viewport, clustered for the zoom level
+    from the precomputed pyramid instead of a radius search.
+    """
+    if cluster_pyramid is None:
+        raise HTTPException(status_code=503, detail="Viewport clustering not available")
+    if min_lat > max_lat or min_lng > max_lng:
+        raise HTTPException(status_code=400, detail="min_lat/min_lng must not exceed max_lat/max_lng")
+
+    result = cluster_pyramid.query(min_lat, min_lng, max_lat, max_lng, zoom)
+    return ViewportResponse(**result)
+
+
+@app.get("/tiles/{z}/{x}/{y}.mvt")
+async def vector_tile(z: int, x: int, y: int, request: Request):
+    """
+    Pre-generated Mapbox Vector Tile for signs and garages.
+    The ETag is the tile's content hash, so unchanged tiles revalidate with a 304.
+    """
+    if tile_archive is None:
+        raise HTTPException(status_code=503, detail="Vector tiles not available")
+    # Check the zoom first: it bounds the shifts below, and the archive has nothing outside it
+    if not (tile_archive.min_zoom <= z <= tile_archive.max_zoom):
+        raise HTTPException(status_code=400, detail=f"Zoom must be between {tile_archive.min_zoom} and {tile_archive.max_zoom}")
+    if not (0 <= x < (1 << z)) or not (0 <= y < (1 << z)):
+        raise HTTPException(status_code=400, detail="Invalid tile coordinates")
+
+    cache_headers = {"Cache-Control": f"public, max-age={TILE_CACHE_MAX_AGE}"}
+    tile = tile_archive.get(z, x, y)
+    if tile is None:
+        # Empty tile: cache the absence too
+        return Response(status_code=204, headers=cache_headers)
+
+    data, tile_id = tile
+    etag = f'"{tile_id}"'
+    headers = {**cache_headers, "ETag": etag}
+    if etag in [t.strip() for t in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+    if tile_archive.encoding == "gzip":
+        headers["Content-Encoding"] = "gzip"
+    return Response(content=data, media_type="application/vnd.mapbox-vector-tile", headers=headers)
+
+
 @app.post("/followup-question", response_model=FollowUpResponse)
 async def followup_question(req: FollowUpRequest) -> FollowUpResponse:
     """
@@ -411,8 +883,8 @@ async def followup_question(req: FollowUpRequest) -> FollowUpResponse:
     
     datetime_str = datetime.now().strftime("%a %I:%M%p")  # Current datetime in required format
 
-    prompt = followup_prompt_template.format(
-        previous_summary=json.dumps(previous_summary, indent=2),
+    prompt = followup_user_template.format(
+        previous_summary=compact_summary(previous_summary, followup_budget.summary_chars),
         datetime_str=datetime_str,
         question=req.question
     )
@@ -420,17 +892,59 @@ async def followup_question(req: FollowUpRequest) -> FollowUpResponse:
     if not client:
         raise HTTPException(status_code=503, detail="OpenAI client not available")
         
-    response = client.chat.completions.create(
+    response = await asyncio.to_thread(
+        profiled(client.chat.completions.create),
         model="gpt-4o-mini",
-        messages=[{"role": "user", "content": prompt}],
-        max_tokens=280,
+        messages=[
+            {"role": "system", "content": followup_prompt},
+            {"role": "user", "content": prompt},
+        ],
+        max_tokens=followup_budget.max_tokens,
     )
+    usage = llm_usage.record("followup", response)
+    log.info(f"Token usage for follow-up: {usage}")
 
     answer = response.choices[0].message.content.strip()
     return FollowUpResponse(answer=answer)
 
 
 
+@app.post("/admin/refresh-dataset")
+async def refresh_dataset(req: DatasetRefreshRequest, request: Request):
+    """
+    Diff a new export of a dataset against the loaded one and swap it in without a restart.
+    Runs in the background; in-flight searches keep using the old version.
+    """
+    require_admin(request)
+    if SPATIAL_BACKEND != "local":
+        raise HTTPException(status_code=409, detail=f"Dataset refresh needs SPATIAL_BACKEND=local, not {SPATIAL_BACKEND}")
+    if req.dataset not in spatial_query.DATASET_PATHS:
+        raise HTTPException(status_code=400, detail=f"Unknown dataset: {req.dataset}")
+
+    spatial_client.refresh_in_background(req.dataset, req.path, log=log)
+    return {"status": "started", "dataset": req.dataset, "current_version": spatial_client.version}
+
+
+@app.get("/admin/profiles")
+async def list_profiles(request: Request):
+    """Most recent request profiles (metadata only)."""
+    require_admin(request)
+    return {"profiles": profiler.list()}
+
+
+@app.get("/admin/profiles/{profile_id}")
+async def download_profile(profile_id: str, request: Request):
+    """A profile as collapsed stacks; open it in speedscope or feed it to flamegraph.pl."""
+    require_admin(request)
+    collapsed = profiler.collapsed(profile_id)
+    if collapsed is None:
+        raise HTTPException(status_code=404, detail="Profile not found or evicted")
+    return PlainTextResponse(
+        collapsed,
+        headers={"Content-Disposition": f'attachment; filename="profile-{profile_id}.collapsed.txt"'},
+    )
+
+
 @app.get("/health")
 async def health_check():
     """Detailed health check with service status."""
@@ -443,6 +957,7 @@ async def health_check():
         
         # Test S3 availability
         s3_available = bool(s3_client)
+        spatial_available = bool(spatial_client)
         
         return {
             "status": "healthy",
@@ -450,7 +965,16 @@ async def health_check():
                 "gpt4o": "configured" if openai_available else "missing_api_key",
                 "llm": "working" if llm_working else "error",
                 "parser": "working",
-                "s3": "configured" if s3_available else "missing_credentials"
+                "s3": "configured" if s3_available else "missing_credentials",
+                "spatial": SPATIAL_BACKEND if spatial_available else "not_configured",
+                "dataset_version": dataset_version(),
+                "dataset_refresh": spatial_client.last_refresh if SPATIAL_BACKEND == "local" else None,
+                "search_cache": search_cache.stats(),
+                "search_sessions": search_sessions.stats(),
+                "hedged_search": hedged_query.stats(),
+                "firebase_tokens": firebase_tokens.stats(),
+                "image_jobs": image_jobs.stats(),
+                "llm_usage": llm_usage.stats(),
             },
             "timestamp": datetime.now().isoformat()
         }
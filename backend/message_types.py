@@ -3,9 +3,10 @@ Clean Pydantic models for CanIParkHere API
 Optimized for OpenAPI generation and frontend consumption
 """
 
+from datetime import datetime
 from enum import Enum
 from pydantic import BaseModel, Field
-from typing import Literal
+from typing import Literal, Optional
 
 
 class ParkingCategory(str, Enum):
@@ -37,13 +38,20 @@ class ParkingSearchResponse(BaseModel):
     parking_sign_results: list = Field(..., description="List of parking results found")
     public_parking_results: list = Field(..., description="List of public parking facilities found")
     processing_method: str = Field(default="search_api", description="Processing method identifier")
+    answered_by: Optional[str] = Field(default=None, description="Which backend answered: cache, local, duckdb, postgis or athena")
+    search_token: Optional[str] = Field(default=None, description="Send back as previous_search_token to get only the changes next time")
+    is_incremental: bool = Field(default=False, description="If true, the result lists only hold features added since the previous search; kept signs are in sign_distances")
+    removed_sign_ids: list[str] = Field(default_factory=list, description="IDs of signs no longer in the result set (incremental only)")
+    sign_distances: dict[str, Optional[float]] = Field(default_factory=dict, description="distance_m from the new position for each kept sign, by ID (incremental only)")
+    removed_public_parking_ids: list[str] = Field(default_factory=list, description="IDs of facilities no longer in the result set (incremental only)")
 
-# TODO: Fix this.... 
 class LocationCheckResponse(BaseModel):
     """Response from location-based parking check"""
-    canPark: bool = Field(..., description="Whether parking is allowed at this location")
-    message: str = Field(..., description="Descriptive message about parking rules")
-    processing_method: str = Field(default="location_api", description="Processing method identifier")
+    canPark: Literal["true", "false", "uncertain"] = Field(..., description="Parking permission status")
+    reason: str = Field(..., description="Clear explanation of the parking decision")
+    signs: list = Field(..., description="Nearest applicable signs with distance and their status at the checked time")
+    checked_at: str = Field(..., description="Local time the signs were evaluated at (ISO 8601)")
+    processing_method: str = Field(default="sign_schedules", description="Processing method identifier")
 
 
 class FollowUpRequest(BaseModel):
@@ -61,4 +69,53 @@ class FollowUpResponse(BaseModel):
 class ParkingSearchRequest(BaseModel):
     """Request for location-based parking check"""
     latitude: float = Field(..., description="Latitude coordinate")
-    longitude: float = Field(..., description="Longitude coordinate") 
\ No newline at end of file
+    longitude: float = Field(..., description="Longitude coordinate")
+    categories: Optional[list[str]] = Field(
+        default=None,
+        description="Sign categories to include, as codes (e.g. PPEAK) or descriptions (e.g. Paid Parking). Defaults to every known parking category",
+    )
+    previous_search_token: Optional[str] = Field(
+        default=None,
+        description="search_token from the previous response; if still valid, only the changed features are returned",
+    )
+
+
+class LocationCheckRequest(BaseModel):
+    """Request to check whether parking is allowed at a location right now (or at a given time)"""
+    latitude: float = Field(..., description="Latitude coordinate")
+    longitude: float = Field(..., description="Longitude coordinate")
+    time: Optional[datetime] = Field(
+        default=None,
+        description="Time to check (ISO 8601). Defaults to now; times without a timezone are taken as Seattle local time",
+    )
+
+
+class DatasetRefreshRequest(BaseModel):
+    """Admin request to hot-swap a refreshed dataset into the local spatial index"""
+    dataset: str = Field(..., description="Dataset name, e.g. signs, garages or street_parking")
+    path: Optional[str] = Field(default=None, description="New GeoJSON/Parquet export (defaults to the configured path)")
+
+
+class ViewportResponse(BaseModel):
+    """Signs and garages inside a map viewport, clustered for the zoom level"""
+    zoom: int = Field(..., description="Zoom level the clusters were taken from")
+    clusters: list = Field(..., description="Clusters with lat, lng, total count and counts per kind")
+    points: list = Field(..., description="Individual signs/garages (single-point cells, or everything above the max cluster zoom)")
+    truncated: bool = Field(default=False, description="Whether results were capped")
+    processing_method: str = Field(default="cluster_pyramid", description="Processing method identifier")
+
+
+class JobAcceptedResponse(BaseModel):
+    """Returned with 202 when an image check is queued (async_mode=true)"""
+    job_id: str = Field(..., description="ID to poll at GET /jobs/{job_id}")
+    status: Literal["queued", "running", "done", "error"] = Field(..., description="Job status")
+    status_url: str = Field(..., description="Where to poll for the result")
+
+
+class JobStatusResponse(BaseModel):
+    """Status of a queued image check"""
+    job_id: str = Field(..., description="Job ID")
+    status: Literal["queued", "running", "done", "error"] = Field(..., description="Job status")
+    result: Optional[ParkingCheckResponse] = Field(default=None, description="The parking check, once status is done")
+    error: Optional[str] = Field(default=None, description="Error message, if status is error")
+    error_status: Optional[int] = Field(default=None, description="HTTP status the synchronous check would have failed with, if status is error")
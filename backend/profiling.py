@@ -0,0 +1,161 @@
+"""
+On-demand statistical profiler for live requests.
+
+While a profiled request runs, a sampler thread snapshots the stacks
+(sys._current_frames) of the threads serving it every few milliseconds: the
+event loop thread, plus any worker thread while it runs a function wrapped with
+profiled() (Athena result parsing, OpenAI calls). So work on the loop and in the
+threadpool both shows up, but other requests' threadpool work and background
+threads don't. The loop thread is shared, so concurrent requests' coroutines
+can still appear there. Idle frames (waiting on a lock, queue or selector) are
+skipped.
+
+Stacks are stored in collapsed format ("thread;file:func;... count"), which
+speedscope, flamegraph.pl and most flame graph viewers open directly. The last
+`max_profiles` profiles are kept in a ring buffer.
+"""
+
+import contextvars
+import functools
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+
+# Leaf frames that mean a thread is parked, not working
+IDLE_FUNCTIONS = {"wait", "select", "poll", "epoll", "_wait_for_tstate_lock", "get", "sleep", "accept", "_worker"}
+IDLE_FILES = ("threading.py", "selectors.py", "queue.py", "thread.py", "socket.py")
+
+# Sampler of the request being handled; copied into its tasks and to_thread calls
+_active_sampler = contextvars.ContextVar("active_sampler", default=None)
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+def _is_idle(frame):
+    code = frame.f_code
+    return code.co_name in IDLE_FUNCTIONS and code.co_filename.endswith(IDLE_FILES)
+
+
+class Sampler:
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.threads = Counter()  # idents of the threads serving the request -> nesting depth
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def watch(self, ident):
+        self.threads[ident] += 1
+
+    def unwatch(self, ident):
+        self.threads[ident] -= 1
+        if self.threads[ident] <= 0:
+            del self.threads[ident]
+
+    def _run(self):
+        me = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            names.update({t.ident: t.name for t in threading.enumerate()})
+            for ident, frame in sys._current_frames().items():
+                if ident == me or ident not in self.threads or _is_idle(frame):
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+
+def activate_sampler(sampler):
+    """Make `sampler` the current request's sampler; returns a token for deactivate_sampler()."""
+    sampler.watch(threading.get_ident())
+    return _active_sampler.set(sampler)
+
+
+def deactivate_sampler(token):
+    _active_sampler.reset(token)
+
+
+def profiled(fn):
+    """
+    Wrap fn before handing it to a worker thread, so that thread is sampled while it
+    runs fn on behalf of the current request. Returns fn unchanged if nothing is profiled.
+    """
+    sampler = _active_sampler.get()
+    if sampler is None:
+        return fn
+
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        ident = threading.get_ident()
+        sampler.watch(ident)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            sampler.unwatch(ident)
+
+    return run
+
+
+class Profiler:
+    def __init__(self, max_profiles: int = 20, interval: float = 0.005):
+        self.interval = interval
+        self._profiles = deque(maxlen=max_profiles)
+        # One profile at a time: the loop thread is shared, and it keeps overhead bounded
+        self._active = threading.Lock()
+
+    def try_start(self):
+        """A running Sampler, or None if another request is already being profiled."""
+        if not self._active.acquire(blocking=False):
+            return None
+        sampler = Sampler(self.interval)
+        sampler.started_at = time.time()
+        sampler.start()
+        return sampler
+
+    def finish(self, sampler, method: str, path: str, status: int, trigger: str) -> str:
+        """Stop sampler and store its profile. Joins the sampler thread, so call it off the event loop."""
+        try:
+            sampler.stop()
+        finally:
+            self._active.release()
+        profile = {
+            "id": uuid.uuid4().hex[:12],
+            "method": method,
+            "path": path,
+            "status": status,
+            "trigger": trigger,
+            "started_at": sampler.started_at,
+            "duration_ms": round(1000 * (time.time() - sampler.started_at), 2),
+            "samples": sampler.samples,
+            "stacks": sampler.stacks,
+        }
+        self._profiles.append(profile)
+        return profile["id"]
+
+    def list(self):
+        return [{k: v for k, v in p.items() if k != "stacks"} for p in reversed(self._profiles)]
+
+    def collapsed(self, profile_id: str):
+        """Collapsed-stack text for a stored profile, or None."""
+        for p in self._profiles:
+            if p["id"] == profile_id:
+                return "".join(f"{stack} {count}\n" for stack, count in p["stacks"].most_common())
+        return None
@@ -0,0 +1,138 @@
+"""
+Deadline-aware hedged queries for /search-parking.
+
+The primary (fast, in-process or pooled) backend is queried first. If it has
+not answered within hedge_delay, fails, comes back empty, or is known to be
+stale, the same search is also sent to the hedge backend (Athena). The first
+complete result wins and the other attempt is cancelled; for Athena that stops
+the running query. When the primary is known to be stale the hedge wins instead:
+the primary's answer is only held as a fallback in case the hedge fails, comes
+back empty or misses the deadline. Nothing is waited on past the request's deadline.
+"""
+
+import asyncio
+import threading
+import time
+from collections import Counter
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+def _is_complete(result) -> bool:
+    signs, garages = result
+    return bool(signs or garages)
+
+
+def _consume(task):
+    # Abandoned attempts may still fail; retrieve the exception so it isn't logged as unhandled
+    if not task.cancelled():
+        task.exception()
+
+
+class HedgedQuery:
+    def __init__(self, deadline: float = 10.0, hedge_delay: float = 0.5):
+        self.deadline = deadline
+        self.hedge_delay = hedge_delay
+        self.requests = 0
+        self.hedged = 0
+        self.cancelled = 0  # attempts cancelled
+        self.cancelled_requests = 0  # requests with at least one attempt cancelled
+        self.deadline_exceeded = 0
+        self.hedge_reasons = Counter()
+        self.wins = Counter()
+
+    async def run(self, primary, hedge=None, hedge_reason=None):
+        """
+        primary / hedge: (name, fn) where fn(cancel_event) returns an awaitable
+        of (signs, garages). hedge_reason starts the hedge right away (e.g. "stale")
+        and prefers its answer over the primary's.
+        Returns ((signs, garages), name of the backend that answered).
+        """
+        self.requests += 1
+        start = time.monotonic()
+        attempts = {}
+        hedge_started = False
+        fallback = None
+        held = None  # complete primary result, waiting on a preferred hedge
+        error = None
+
+        def launch(name, fn):
+            cancel_event = threading.Event()
+            task = asyncio.ensure_future(fn(cancel_event))
+            task.add_done_callback(_consume)
+            attempts[task] = (name, cancel_event)
+
+        def start_hedge(reason):
+            nonlocal hedge_started
+            if hedge is None or hedge_started:
+                return
+            hedge_started = True
+            self.hedged += 1
+            self.hedge_reasons[reason] += 1
+            launch(*hedge)
+
+        launch(*primary)
+        if hedge_reason:
+            start_hedge(hedge_reason)
+
+        try:
+            while attempts:
+                now = time.monotonic() - start
+                timeout = self.deadline - now
+                if hedge is not None and not hedge_started:
+                    timeout = min(timeout, self.hedge_delay - now)
+                done, _ = await asyncio.wait(attempts, timeout=max(0, timeout), return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    if time.monotonic() - start >= self.deadline:
+                        self.deadline_exceeded += 1
+                        if held is not None:
+                            break
+                        raise DeadlineExceeded(f"No backend answered within {self.deadline:.1f}s")
+                    start_hedge("slow")
+                    continue
+
+                for task in done:
+                    name, _ = attempts.pop(task)
+                    if task.exception() is not None:
+                        error = task.exception()
+                        start_hedge("error")
+                    elif _is_complete(task.result()):
+                        if hedge_reason and hedge_started and name == primary[0] and attempts:
+                            # Stale primary: keep its answer, but give the hedge until the deadline
+                            held = (task.result(), name)
+                            continue
+                        self.wins[name] += 1
+                        return task.result(), name
+                    else:
+                        # Empty: maybe the primary doesn't cover this area; keep it in case nobody does better
+                        fallback = fallback or (task.result(), name)
+                        start_hedge("miss")
+
+            fallback = held or fallback
+            if fallback is not None:
+                self.wins[fallback[1]] += 1
+                return fallback
+            raise error
+        finally:
+            if attempts:
+                self.cancelled_requests += 1
+            for task, (name, cancel_event) in attempts.items():
+                cancel_event.set()
+                task.cancel()
+                self.cancelled += 1
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "hedged": self.hedged,
+            "hedge_rate": round(self.hedged / self.requests, 3) if self.requests else 0.0,
+            "hedge_reasons": dict(self.hedge_reasons),
+            "cancelled": self.cancelled,
+            "cancelled_requests": self.cancelled_requests,
+            "cancel_rate": round(self.cancelled_requests / self.requests, 3) if self.requests else 0.0,
+            "deadline_exceeded": self.deadline_exceeded,
+            "wins": dict(self.wins),
+        }
@@ -0,0 +1,58 @@
+"""
+Small in-memory LRU cache for /search-parking results.
+
+Keys include the dataset version, so results computed against an old
+dataset can never be served after a refresh; clear() also drops them eagerly.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class SearchCache:
+    def __init__(self, max_entries: int = 2048, ttl_seconds: float = 300, snap_decimals: int = 4):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # 4 decimals is ~11 m, close enough to share results between nearby requests
+        self.snap_decimals = snap_decimals
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, version, lat: float, lon: float, *params):
+        return (version, round(lat, self.snap_decimals), round(lon, self.snap_decimals), *params)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[0] > self.ttl_seconds:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self, *_):
+        """Drop everything. Accepts and ignores extra args so it can be used as a swap listener."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
@@ -0,0 +1,89 @@
+"""
+Incremental /search-parking for clients that keep moving.
+
+Every search response carries a search_token that maps to the IDs of the
+features it returned. When the client sends that token back with its next
+position, only the features that entered the result set are sent in full, plus
+the IDs of the ones that left. Signs that stayed are only sent as an
+{id: distance_m} map, since their distance from the new position changes but
+nothing else does. Tiny moves skip the spatial query entirely.
+"""
+
+import hashlib
+import math
+import uuid
+
+from search_cache import SearchCache
+
+
+def feature_id(kind: str, lat, lng, *fields) -> str:
+    """Stable ID from rounded coordinates and a few identifying properties."""
+    lat = round(float(lat), 6) if lat is not None else None
+    lng = round(float(lng), 6) if lng is not None else None
+    raw = "|".join(str(v) for v in (kind, lat, lng, *fields))
+    return hashlib.sha1(raw.encode()).hexdigest()[:16]
+
+
+def distance_m(lat1, lon1, lat2, lon2) -> float:
+    # Equirectangular approximation, fine for the few hundred meters between searches
+    x = math.radians(lon2 - lon1) * math.cos(math.radians((lat1 + lat2) / 2))
+    y = math.radians(lat2 - lat1)
+    return 6371000 * math.hypot(x, y)
+
+
+def _round(meters):
+    return round(float(meters), 1) if meters is not None else None
+
+
+class SearchSessions:
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 900, min_move_meters: float = 25):
+        self._results = SearchCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self.min_move_meters = min_move_meters
+        self.skipped = 0
+        self.incremental = 0
+
+    def previous(self, token, version, categories):
+        """The stored search for token, if it is still usable for a diff against this request."""
+        if not token:
+            return None
+        prev = self._results.get(token)
+        if prev is None or prev["version"] != version or prev["categories"] != categories:
+            return None
+        return prev
+
+    def moved_enough(self, prev, lat, lon) -> bool:
+        if distance_m(prev["lat"], prev["lon"], lat, lon) >= self.min_move_meters:
+            return True
+        self.skipped += 1
+        return False
+
+    def save(self, version, categories, lat, lon, signs, garages) -> str:
+        token = uuid.uuid4().hex
+        self._results.put(token, {
+            "version": version,
+            "categories": categories,
+            "lat": lat,
+            "lon": lon,
+            "signs": frozenset(f["id"] for f in signs),
+            "garages": frozenset(f["id"] for f in garages),
+        })
+        return token
+
+    def diff(self, prev, signs, garages):
+        """
+        (added signs, {id: distance_m} of kept signs, removed sign IDs, added garages,
+        removed garage IDs) relative to prev.
+        """
+        self.incremental += 1
+        new_signs = {f["id"] for f in signs}
+        new_garages = {f["id"] for f in garages}
+        return (
+            [f for f in signs if f["id"] not in prev["signs"]],
+            {f["id"]: _round(f.get("distance_m")) for f in signs if f["id"] in prev["signs"]},
+            sorted(prev["signs"] - new_signs),
+            [f for f in garages if f["id"] not in prev["garages"]],
+            sorted(prev["garages"] - new_garages),
+        )
+
+    def stats(self):
+        return {**self._results.stats(), "incremental": self.incremental, "skipped_small_moves": self.skipped}